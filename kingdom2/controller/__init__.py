@@ -1 +1,3 @@
 from .cli import GameCLI
+from .recorder import CommandRecorder
+from .recorder import GameReplayer
@@ -1,8 +1,9 @@
 import cmd
+import contextlib
 from .utils import *
+import io
 import logging
 import os
-import random
 
 import kingdom2.model as model
 import kingdom2.view as view
@@ -12,15 +13,35 @@ class GameCLI(cmd.Cmd):
     intro = "Welcome to The Kingdom 2.\nType 'start' to get going!\nType 'help' for a list of commands."
     prompt = "What next?"
 
-    def __init__(self):
+    def __init__(self, verbose : bool = False, event_log : str = None, seed : int = None, recorder = None):
 
         super(GameCLI, self).__init__()
 
-        self.model = model.Game("Kingdom 2")
+        self.model = model.Game("Kingdom 2", seed=seed, verbose=verbose)
         self.view = view.TextView(self.model)
 
+        # Something to record the commands that get typed in so that the session can be replayed
+        self.recorder = recorder
+
+        # Keep a log of all of the game's events if asked to
+        self.event_log = None
+        if event_log is not None:
+            self.event_log = model.EventLogSink(event_log)
+            self.event_log.attach(self.model.events)
+
     def run(self):
-        self.cmdloop()
+        try:
+            self.cmdloop()
+        finally:
+            if self.event_log is not None:
+                self.event_log.close()
+            if self.recorder is not None:
+                self.recorder.close()
+
+    def precmd(self, line):
+        if self.recorder is not None and line.strip() != "":
+            self.recorder.record(self.model.tick_count, line)
+        return line
 
     def emptyline(self):
         pass
@@ -47,12 +68,17 @@ class GameCLI(cmd.Cmd):
         self.print_events()
 
     def do_tick(self, arg : str = "1"):
+        """Move the game on by a number of ticks e.g. 'tick 10'"""
+        ticks = parse_ticks(arg)
+        if ticks is None:
+            print("Please specify a whole number of ticks greater than 0 e.g. 'tick 10'.")
+            return
 
-        i = is_numeric(arg)
-        if i is not None:
-            for i in range (0, i):
-                self.model.tick()
-                self.view.tick()
+        try:
+            self.model.tick(ticks)
+            self.view.tick(ticks)
+        except Exception as err:
+            print(str(err))
 
         self.print_events()
 
@@ -64,31 +90,204 @@ class GameCLI(cmd.Cmd):
         inv_view.draw()
 
     def do_map(self, arg):
-        map_view = view.WorldMapTextView(self.model.map)
-        map_view.draw()
+        """Draw the map, optionally zoomed out to a level of detail e.g. 'map 2'"""
+        level = self.parse_level(arg)
+        if level is None:
+            return
+
+        world_map = self.wait_for_map()
+        if world_map is None:
+            return
+
+        try:
+            map_view = view.WorldMapTextView(world_map)
+            map_view.draw(level=level)
+        except Exception as err:
+            print(str(err))
         #map_view.draw((5,5,10,10))
 
-    def do_topo(self, arg):
-        map_view = view.WorldTopoModelTextView(self.model.map)
+    def do_watch(self, arg):
+        """Keep the map on screen while the game ticks, only redrawing squares that change e.g. 'watch 20'"""
+        ticks = parse_ticks(arg)
+        if ticks is None:
+            print("Please specify a whole number of ticks greater than 0 e.g. 'watch 20'.")
+            return
+
+        world_map = self.wait_for_map()
+        if world_map is None:
+            return
+
+        map_view = view.WorldMapDiffTextView(world_map)
         map_view.draw()
+
+        # Anything printed while ticking, like creations being completed, would land in the middle of the map
+        # and throw out where the changes get drawn, so keep it until we have finished watching
+        messages = io.StringIO()
+
+        try:
+            for i in range(0, ticks):
+                with contextlib.redirect_stdout(messages):
+                    self.model.tick()
+                    self.view.tick()
+                map_view.draw()
+        finally:
+            map_view.close()
+            print(messages.getvalue(), end="")
+
+        self.print_events()
+
+    def do_topo(self, arg):
+        """Print the map altitudes, optionally zoomed out to a level of detail e.g. 'topo 2'"""
+        level = self.parse_level(arg)
+        if level is None:
+            return
+
+        world_map = self.wait_for_map()
+        if world_map is None:
+            return
+
+        try:
+            map_view = view.WorldTopoModelTextView(world_map)
+            map_view.draw(level=level)
+        except Exception as err:
+            print(str(err))
         #map_view.draw((5,5,10,10))
 
+    def do_export(self, arg):
+        """Export the map altitudes to a .csv, .npy or binary file e.g. 'export topo.csv' or 'export topo.npy 0 0 10 10'"""
+        args = arg.split()
+        if len(args) == 0:
+            print("Please specify a file name to export to.")
+            return
+
+        rect = None
+        if len(args) > 1:
+            rect = [is_numeric(a) for a in args[1:]]
+            if len(rect) != 4 or any(isinstance(value, int) is False for value in rect):
+                print("Please specify the area to export as 4 whole numbers x y width height "
+                      "e.g. 'export topo.npy 0 0 10 10'.")
+                return
+
+        world_map = self.wait_for_map()
+        if world_map is None:
+            return
+
+        try:
+            world_map.export_topology(args[0], rect)
+            print("Altitudes exported to {0}.".format(args[0]))
+        except Exception as err:
+            print(str(err))
+
+    def do_save(self, arg):
+        """Save the game to a file e.g. 'save kingdom.k2s', or just 'save' to add what has changed since the last save"""
+        file_name = arg.strip()
+        if file_name == "":
+            file_name = None
+        elif self.wait_for_map() is None:
+            return
+
+        try:
+            self.model.save(file_name)
+            print("Game saved.")
+        except Exception as err:
+            print(str(err))
+
+    def do_load(self, arg):
+        """Load a saved game from a file e.g. 'load kingdom.k2s'"""
+        file_name = arg.strip()
+        if file_name == "":
+            print("Please specify a file name to load from.")
+            return
+
+        try:
+            self.model.load(file_name)
+            print("Game loaded at tick {0}.".format(self.model.tick_count))
+        except Exception as err:
+            print(str(err))
+
+        self.print_events()
+
+    def do_plan(self, arg):
+        """Plan how to make a creatable and how many the inventory can make e.g. 'plan Small Brick House 3'"""
+        if self.model.planner is None:
+            print("There is nothing to plan yet.  Type 'start' to get going!")
+            return
+
+        args = arg.split()
+        count = 1
+        if len(args) > 1 and is_numeric(args[-1]) is not None:
+            count = parse_count(args.pop())
+            if count is None:
+                print("Please specify a whole number to make greater than 0 e.g. 'plan Small Brick House 3'.")
+                return
+
+        name = " ".join(args)
+        if name not in self.model.creatables.names:
+            print("Creatable '{0}' not found.".format(name))
+            return
+
+        print(str(self.model.planner.plan(name, count)))
+
+        buildable = self.model.planner.max_buildable(name, self.model.inventory)
+        if buildable is None:
+            print("No raw resources needed so there is no limit.")
+        else:
+            print("The inventory has enough resources, counting anything already made, for {0}.".format(buildable))
+
     def do_test(self, arg):
 
-        resource_types = model.ResourceFactory.get_resource_types()
+        resource_types = self.model.resources.get_resource_types()
 
         for type in resource_types:
-            new_resource = model.ResourceFactory.get_resource(type)
-            self.model.inventory.add_resource(new_resource, random.randint(20,60))
+            new_resource = self.model.resources.get_resource(type)
+            self.model.inventory.add_resource(new_resource, self.model.rng.randint(20,60))
 
         self.model.inventory.print()
 
+        # Check all of the creatables against the inventory in one go
+        creatable_mask = self.model.creatables.get_creatable_mask(self.model.inventory)
+
         for creatable_name in self.model.creatables.names:
             creatable = self.model.creatables.get_creatable_copy(creatable_name)
-            ok = self.model.inventory.is_creatable(creatable)
+            ok = bool(creatable_mask[creatable.type_id])
             print("{0}: creatable = {1}".format(creatable.name, ok))
             self.model.add_creation(creatable)
 
+    # Get the level of detail from a command argument, which defaults to 0.  Returns None if it isn't valid.
+    def parse_level(self, arg: str):
+
+        if arg.strip() == "":
+            return 0
+
+        level = is_numeric(arg)
+        if isinstance(level, int) is False or level < 0:
+            print("Please specify the level of detail as a whole number from 0 e.g. 'map 2'.")
+            return None
+
+        return level
+
+    # Wait for the map to finish being made, showing progress while we wait.
+    # Returns the map or None if there isn't one.
+    def wait_for_map(self):
+
+        if self.model.wait_for_map(timeout=0) is False:
+            print("Waiting for the map to be made...")
+            while self.model.wait_for_map(timeout=0.25) is False:
+                self.print_events()
+
+        self.print_events()
+
+        try:
+            world_map = self.model.map
+        except Exception as err:
+            print("Unable to make the map: {0}".format(err))
+            return None
+
+        if world_map is None:
+            print("There is no map yet.  Type 'start' to get going!")
+
+        return world_map
+
     def print_events(self):
 
         # Print any events that got raised
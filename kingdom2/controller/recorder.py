@@ -0,0 +1,213 @@
+import contextlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+from .cli import GameCLI
+from .utils import parse_ticks
+
+
+class CommandRecorder:
+    '''
+    Records the seed of a game and every command typed into the CLI along with the tick it was typed at,
+    one JSON object per line, so that the session can be replayed exactly.
+    '''
+
+    FILE_VERSION = 1
+
+    def __init__(self, file_name: str, seed: int):
+
+        self.file_name = file_name
+        self.seed = seed
+
+        self._file = open(file_name, "w", encoding="utf-8")
+        self._write({"version": CommandRecorder.FILE_VERSION, "seed": seed})
+
+    def record(self, tick: int, line: str):
+        self._write({"tick": tick, "command": line})
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    # Write each line straight away so that nothing is lost if the game crashes
+    def _write(self, record: dict):
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    # Read a recording and return its seed and a list of (tick, command)
+    @staticmethod
+    def read(file_name: str):
+
+        with open(file_name, "r", encoding="utf-8") as recording:
+            header = json.loads(recording.readline())
+            if header.get("version") != CommandRecorder.FILE_VERSION:
+                raise Exception("{0} is not a recording!".format(file_name))
+
+            commands = []
+            for line in recording:
+                if line.strip() != "":
+                    record = json.loads(line)
+                    commands.append((record["tick"], record["command"]))
+
+        return header["seed"], commands
+
+
+class GameReplayer:
+    '''
+    Plays a recorded session back through the CLI as fast as possible with nothing drawn.  Commands that only
+    show things or write files are skipped and ticking is done in one go.  A snapshot of the game is taken every
+    so many ticks so that seeking to a tick only has to replay the commands since the nearest snapshot.
+    '''
+
+    # Commands that don't change the game
+    SKIPPED_COMMANDS = ("print", "inv", "map", "topo", "plan", "export", "save", "help", "quit")
+
+    # Commands that move the game on by a number of ticks
+    TICK_COMMANDS = ("tick", "watch")
+
+    DEFAULT_CHECKPOINT_INTERVAL = 1000
+
+    def __init__(self, file_name: str, checkpoint_interval: int = DEFAULT_CHECKPOINT_INTERVAL,
+                 checkpoint_dir: str = None):
+
+        self.file_name = file_name
+        self.seed, self.commands = CommandRecorder.read(file_name)
+        self.checkpoint_interval = checkpoint_interval
+
+        self._own_checkpoint_dir = checkpoint_dir is None
+        if checkpoint_dir is None:
+            checkpoint_dir = tempfile.mkdtemp(prefix="kingdom2_replay_")
+        self.checkpoint_dir = checkpoint_dir
+
+        # (tick, command position, ticks of that command already done, file name) of each snapshot taken
+        self.checkpoints = []
+        self.last_checkpoint_tick = 0
+
+        self.restart()
+
+    @property
+    def game(self):
+        return self.cli.model
+
+    @property
+    def tick_count(self):
+        return self.game.tick_count
+
+    # Go back to the start of the recording
+    def restart(self):
+        self.cli = GameCLI(seed=self.seed)
+        self.position = 0
+        self.offset = 0
+
+    # Replay commands until the end of the recording or until the game reaches the specified tick
+    def run(self, until_tick: int = None):
+
+        with open(os.devnull, "w") as null, contextlib.redirect_stdout(null):
+
+            while self.position < len(self.commands):
+
+                tick, line = self.commands[self.position]
+
+                if until_tick is not None and tick > until_tick:
+                    break
+
+                if self.game.tick_count != tick + self.offset:
+                    raise Exception("Replay out of step at command {0} '{1}': recorded at tick {2} but at tick {3}!"
+                                    .format(self.position, line, tick + self.offset, self.game.tick_count))
+
+                command, arg, line = self.cli.parseline(line)
+
+                if command in GameReplayer.TICK_COMMANDS:
+                    # Work out the ticks the same way that the CLI does, which ignores the command if they are bad
+                    ticks = parse_ticks(arg)
+                    if ticks is None or self.can_tick(command) is False:
+                        ticks = 0
+
+                    # Stop at the next checkpoint or the tick that we are running to if that comes first
+                    remaining = ticks - self.offset
+                    step = min(remaining, self.next_checkpoint - self.game.tick_count)
+                    if until_tick is not None:
+                        step = min(step, until_tick - self.game.tick_count)
+
+                    if step > 0:
+                        self.game.tick(step)
+                        self.offset += step
+
+                    if self.offset >= ticks:
+                        self.position += 1
+                        self.offset = 0
+                    elif until_tick is not None and self.game.tick_count >= until_tick:
+                        break
+
+                else:
+                    if command not in GameReplayer.SKIPPED_COMMANDS:
+                        self.cli.onecmd(line)
+                    self.position += 1
+
+                # Nobody is watching so throw the events away
+                while self.game.get_next_event() is not None:
+                    pass
+
+                if self.game.tick_count >= self.next_checkpoint:
+                    self.checkpoint()
+
+    # Would the CLI have ticked the game for this command?  It can't before the game has started and
+    # 'watch' gives up without ticking if there is no map to watch.
+    def can_tick(self, command: str):
+
+        if self.game.scheduler is None:
+            return False
+
+        if command == "watch":
+            self.game.wait_for_map()
+            try:
+                return self.game.map is not None
+            except Exception:
+                return False
+
+        return True
+
+    # Move the game to the specified tick, starting from the nearest checkpoint before it
+    def seek(self, tick: int):
+
+        checkpoint = None
+        for checkpoint_tick, position, offset, file_name in self.checkpoints:
+            if checkpoint_tick <= tick:
+                checkpoint = (checkpoint_tick, position, offset, file_name)
+
+        if checkpoint is not None and (checkpoint[0] > self.game.tick_count or tick < self.game.tick_count):
+            checkpoint_tick, self.position, self.offset, file_name = checkpoint
+            with open(os.devnull, "w") as null, contextlib.redirect_stdout(null):
+                self.game.load(file_name)
+        elif tick < self.game.tick_count:
+            self.restart()
+
+        self.run(until_tick=tick)
+
+    # The tick of the next checkpoint after the latest one we have tried to take
+    @property
+    def next_checkpoint(self):
+        return (self.last_checkpoint_tick // self.checkpoint_interval + 1) * self.checkpoint_interval
+
+    # Take a snapshot of the game as it is now.  If it can't be saved then carry on without it.
+    def checkpoint(self):
+
+        tick = self.game.tick_count
+        self.last_checkpoint_tick = max(self.last_checkpoint_tick, tick)
+        file_name = os.path.join(self.checkpoint_dir, "checkpoint_{0}.k2s".format(tick))
+
+        try:
+            self.game.save(file_name)
+        except Exception as err:
+            logging.warning("%s: unable to take a checkpoint at tick %d: %s", __class__, tick, err)
+            return
+
+        self.checkpoints.append((tick, self.position, self.offset, file_name))
+
+    def close(self):
+        if self._own_checkpoint_dir is True:
+            shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
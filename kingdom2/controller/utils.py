@@ -76,3 +76,20 @@ def is_numeric(s):
         except:
             x = None
     return x
+
+
+# Get a count from a command argument, which defaults to 1.  Returns None if it isn't a whole number greater than 0.
+def parse_count(arg: str):
+    if arg.strip() == "":
+        return 1
+
+    count = is_numeric(arg)
+    if isinstance(count, int) is False or count < 1:
+        return None
+
+    return count
+
+
+# Get the number of ticks from a command argument in the same way as any other count
+def parse_ticks(arg: str):
+    return parse_count(arg)
@@ -1,5 +1,19 @@
 from .model import Game
+from .model import Catalog
 from .model import Inventory
 from .model import WorldMap
-from .utils import EventQueue
+from .model import ChunkedWorldMap
+from .model import TilePalette
+from .model import Resource
+from .model import ResourceFactory
+from .model import Creatable
+from .model import CreatableInstance
+from .model import Creation
+from .model import CreationTable
+from .model import CreatableFactoryXML
+from .planner import ProductionPlanner
+from .planner import ProductionPlan
+from .snapshot import GameSaver
+from .utils import EventBus
 from .utils import Event
+from .event_log import EventLogSink
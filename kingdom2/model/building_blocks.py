@@ -1,12 +1,20 @@
-import copy
+import collections
 import csv
+import heapq
+import json
+import hashlib
 import logging
-import random
-from xml.dom.minidom import *
-
-import numpy
+import marshal
+import os
+import types
+import xml.etree.ElementTree as ElementTree
 
+from . import topography
 from .utils import is_numeric
+from .utils import lazy_import
+
+numpy = lazy_import("numpy")
+futures = lazy_import("concurrent.futures")
 
 
 class Resource:
@@ -18,6 +26,9 @@ class Resource:
         self.category = category
         self.graphic = graphic
 
+        # Dense id given to the resource by the ResourceFactory
+        self.id = None
+
     def __str__(self):
         _str = "{0} ({3}): {1} ({2})".format(self.name, self.description, self.category, self.graphic)
         return _str
@@ -33,6 +44,13 @@ class Creatable():
         self.ticks_required = ticks_required
         self.output = {}
 
+        # Row of the creatable in its CreatableFactoryXML and its compiled pre-requisites
+        self.type_id = None
+        self._requirements = None
+
+        # Set once the creatable is a shared catalog prototype whose recipe can't change
+        self._frozen = False
+
     def __str__(self):
 
         _str = "{0} ({1}) {2}% complete".format(self.name, self.description, self.percent_complete)
@@ -64,15 +82,43 @@ class Creatable():
 
         return percent_complete
 
+    # Stop the recipe from being changed so that the creatable can be shared as a prototype
+    def freeze(self):
+        self.pre_requisites = types.MappingProxyType(self.pre_requisites)
+        self.output = types.MappingProxyType(self.output)
+        self._frozen = True
+
     def add_pre_requisite(self, new_resource_name: str, item_count: int = 1):
 
+        if self._frozen is True:
+            raise Exception("Creatable {0} is a shared prototype and can't be changed".format(self.name))
+
         if new_resource_name not in self.pre_requisites.keys():
             self.pre_requisites[new_resource_name] = 0
 
         self.pre_requisites[new_resource_name] += item_count
 
+        # The pre-requisites no longer match the catalog so they need compiling again
+        self.type_id = None
+        self._requirements = None
+
+    # Get the pre-requisites as arrays of resource ids and counts in the specified resource catalog.
+    # Resources that don't exist get an id of -1.
+    def get_requirements(self, resource_factory):
+
+        if self._requirements is None or self._requirements[0] is not resource_factory:
+            ids = numpy.array([resource_factory.get_resource_id(name) for name in self.pre_requisites.keys()],
+                              dtype=numpy.int64)
+            counts = numpy.array(list(self.pre_requisites.values()), dtype=numpy.int64)
+            self._requirements = (resource_factory, ids, counts)
+
+        return self._requirements[1:]
+
     def add_output(self, new_resource_name: str, item_count: int = 1):
 
+        if self._frozen is True:
+            raise Exception("Creatable {0} is a shared prototype and can't be changed".format(self.name))
+
         if new_resource_name not in self.output.keys():
             self.output[new_resource_name] = 0
 
@@ -88,44 +134,140 @@ class Creatable():
         print("Construction complete for {0}!".format(self.name))
 
 
+class CreatableInstance:
+    '''
+    A creatable made from a shared catalog prototype.  The instance only holds its own progress and reads the
+    recipe from the prototype, unless the recipe is customised in which case the instance takes its own copy first.
+    It looks like a Creatable but is not one, so nothing from Creatable can touch state that the instance doesn't have.
+    '''
+
+    def __init__(self, prototype: Creatable):
+        self._prototype = prototype
+        self._custom = None
+        self.ticks_done = 0
+
+    @property
+    def recipe(self):
+        if self._custom is not None:
+            return self._custom
+        return self._prototype
+
+    @property
+    def name(self):
+        return self.recipe.name
+
+    @property
+    def description(self):
+        return self.recipe.description
+
+    @property
+    def ticks_required(self):
+        return self.recipe.ticks_required
+
+    @property
+    def pre_requisites(self):
+        return self.recipe.pre_requisites
+
+    @property
+    def output(self):
+        return self.recipe.output
+
+    @property
+    def type_id(self):
+        return self.recipe.type_id
+
+    # Show, progress and report completion the same way as a Creatable
+    __str__ = Creatable.__str__
+    is_complete = Creatable.is_complete
+    percent_complete = Creatable.percent_complete
+    tick = Creatable.tick
+    do_complete = Creatable.do_complete
+
+    def get_requirements(self, resource_factory):
+        return self.recipe.get_requirements(resource_factory)
+
+    # Take a copy of the prototype's recipe the first time that it is changed
+    def customise(self):
+        if self._custom is None:
+            self._custom = Creatable(self._prototype.name, self._prototype.description,
+                                     self._prototype.ticks_required)
+            self._custom.pre_requisites = dict(self._prototype.pre_requisites)
+            self._custom.output = dict(self._prototype.output)
+
+        return self._custom
+
+    def add_pre_requisite(self, new_resource_name: str, item_count: int = 1):
+        self.customise().add_pre_requisite(new_resource_name, item_count)
+
+    def add_output(self, new_resource_name: str, item_count: int = 1):
+        self.customise().add_output(new_resource_name, item_count)
+
+
 class Inventory():
 
-    def __init__(self):
+    def __init__(self, resource_factory):
 
-        self.resources = {}
+        # The catalog of resources that the inventory holds
+        self.resource_factory = resource_factory
+
+        # How many of each resource we have indexed by resource id
+        self.counts = numpy.zeros(resource_factory.get_resource_count(), dtype=numpy.int64)
+
+        # Goes up every time the counts change so others know when to check the inventory again
+        self.version = 0
+
+    @property
+    def resources(self):
+        return {self.resource_factory.get_resource_by_id(i): int(self.counts[i])
+                for i in numpy.flatnonzero(self.counts)}
 
     @property
     def resource_type_count(self):
-        return len(self.resources.keys())
+        return int(numpy.count_nonzero(self.counts))
+
+    # Make sure there is a count for every resource id up to the specified size
+    def resize(self, size: int):
+
+        if size > len(self.counts):
+            self.counts = numpy.concatenate((self.counts, numpy.zeros(size - len(self.counts), dtype=numpy.int64)))
 
     def add_resource(self, new_resource: Resource, item_count: int = 1):
 
-        if new_resource not in self.resources.keys():
-            self.resources[new_resource] = 0
+        self.resize(new_resource.id + 1)
+        self.counts[new_resource.id] += item_count
+        self.version += 1
 
-        self.resources[new_resource] += item_count
+    def get_count(self, resource: Resource):
+
+        if resource.id >= len(self.counts):
+            return 0
+
+        return int(self.counts[resource.id])
 
     def is_creatable(self, new_creatable: Creatable):
 
-        is_creatable = True
+        ids, counts = new_creatable.get_requirements(self.resource_factory)
 
-        for pre_req_name, count in new_creatable.pre_requisites.items():
-            pre_req = ResourceFactory.get_resource(pre_req_name)
-            if pre_req not in self.resources.keys():
-                is_creatable = False
-                break
-            else:
-                inv_count = self.resources[pre_req]
-                if count > inv_count:
-                    is_creatable = False
-                    break
+        if len(ids) > 0 and ids.min() < 0:
+            return False
 
-        return is_creatable
+        self.resize(self.resource_factory.get_resource_count())
+
+        return bool((self.counts[ids] >= counts).all())
+
+    # For a matrix of creatable pre-requisites (one row per creatable, one column per resource id)
+    # find out which of the creatables we have enough resources to create
+    def creatable_mask(self, requirements):
+
+        self.resize(requirements.shape[1])
+
+        return (self.counts[:requirements.shape[1]] >= requirements).all(axis=1)
 
     def print(self):
-        if len(self.resources.keys()) > 0:
-            _str = "Inventory ({0} resource types)".format(self.resource_type_count)
-            for k, v in self.resources.items():
+        resources = self.resources
+        if len(resources.keys()) > 0:
+            _str = "Inventory ({0} resource types)".format(len(resources))
+            for k, v in resources.items():
                 _str += "\n\t{0} ({1}) : {2}".format(k.name, k.description, v)
         else:
             _str = "No resources in your inventory!"
@@ -133,37 +275,352 @@ class Inventory():
         print(_str)
 
 
+class Creation:
+    '''
+    A read only view of one row of a CreationTable that looks like a Creatable.  The recipe comes from the creatable
+    that the row was created from and the progress comes from the table, which is the only thing that changes it.
+    '''
+
+    def __init__(self, table, row: int):
+        self._table = table
+        self._row = row
+
+    @property
+    def row(self):
+        return self._row
+
+    @property
+    def prototype(self):
+        return self._table.get_prototype(self._row)
+
+    @property
+    def name(self):
+        return self.prototype.name
+
+    @property
+    def description(self):
+        return self.prototype.description
+
+    @property
+    def pre_requisites(self):
+        return self.prototype.pre_requisites
+
+    @property
+    def output(self):
+        return self.prototype.output
+
+    @property
+    def type_id(self):
+        return self.prototype.type_id
+
+    @property
+    def ticks_required(self):
+        return int(self._table.ticks_required[self._row])
+
+    @property
+    def ticks_done(self):
+        return self._table.get_ticks_done(self._row)
+
+    # Show and report progress the same way as a Creatable
+    __str__ = Creatable.__str__
+    is_complete = Creatable.is_complete
+    percent_complete = Creatable.percent_complete
+    do_complete = Creatable.do_complete
+
+    def get_requirements(self, resource_factory):
+        return self.prototype.get_requirements(resource_factory)
+
+
+class CreationTable:
+    '''
+    Holds the creations in the game as parallel arrays of catalog type id, ticks done and status rather than one
+    Creatable object each.  The recipes are shared with the catalog and rows can be looked at as Creation objects.
+
+    The progress of a creation that is in progress isn't updated every tick.  Instead the table stores the ticks done
+    as at the tick it was last updated and works out the current value from the table's tick count when asked.
+    '''
+
+    STATUS_WAITING = 0
+    STATUS_IN_PROGRESS = 1
+    STATUS_COMPLETE = 2
+
+    INITIAL_CAPACITY = 64
+
+    def __init__(self, creatables):
+
+        self.creatables = creatables
+        self.tick_count = 0
+
+        self._size = 0
+        self.type_ids = numpy.zeros(0, dtype=numpy.int32)
+        self.ticks_done = numpy.zeros(0, dtype=numpy.int64)
+        self.ticks_required = numpy.zeros(0, dtype=numpy.int64)
+        self.status = numpy.zeros(0, dtype=numpy.int8)
+
+        # For rows in progress, the tick that ticks_done was last updated and the tick that they will complete on
+        self.updated = numpy.zeros(0, dtype=numpy.int64)
+        self.completion = numpy.zeros(0, dtype=numpy.int64)
+
+        # Creatables that don't match a catalog entry indexed by row
+        self._custom = {}
+
+        self._grow(CreationTable.INITIAL_CAPACITY)
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, row: int):
+        if row < 0 or row >= self._size:
+            raise IndexError("Creation {0} is not in the table".format(row))
+        return Creation(self, row)
+
+    def __iter__(self):
+        for row in range(self._size):
+            yield Creation(self, row)
+
+    def _grow(self, capacity: int):
+        for column in ("type_ids", "ticks_done", "ticks_required", "status", "updated", "completion"):
+            old = getattr(self, column)
+            new = numpy.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, column, new)
+
+    # Add a new creation based on the specified creatable and return its row
+    def add(self, new_creation: Creatable):
+
+        row = self._size
+        if row >= len(self.type_ids):
+            self._grow(max(CreationTable.INITIAL_CAPACITY, len(self.type_ids) * 2))
+
+        if new_creation.type_id is None:
+            self._custom[row] = new_creation
+            self.type_ids[row] = -1
+        else:
+            self.type_ids[row] = new_creation.type_id
+
+        self.ticks_done[row] = new_creation.ticks_done
+        self.ticks_required[row] = new_creation.ticks_required
+        self.updated[row] = self.tick_count
+
+        if new_creation.is_complete is True:
+            self.status[row] = CreationTable.STATUS_COMPLETE
+        else:
+            self.status[row] = CreationTable.STATUS_WAITING
+
+        self._size += 1
+
+        return row
+
+    def get_prototype(self, row: int):
+        type_id = self.type_ids[row]
+        if type_id < 0:
+            return self._custom[row]
+        return self.creatables.get_creatable_by_id(type_id)
+
+    def get_ticks_done(self, row: int):
+        ticks_done = int(self.ticks_done[row])
+        if self.status[row] == CreationTable.STATUS_IN_PROGRESS:
+            ticks_done += self.tick_count - int(self.updated[row])
+        return ticks_done
+
+    # Get the ticks done of every row as at the table's tick count
+    def get_all_ticks_done(self):
+
+        ticks_done = self.ticks_done[:self._size].copy()
+
+        in_progress = self.status[:self._size] == CreationTable.STATUS_IN_PROGRESS
+        ticks_done[in_progress] += self.tick_count - self.updated[:self._size][in_progress]
+
+        return ticks_done
+
+    # Overwrite or add the specified rows, e.g. when loading a saved game.  Rows that were in progress are put back
+    # to waiting so that the scheduler checks them again.  Custom gives the recipe of any rows with a type id of -1.
+    def set_rows(self, rows, type_ids, ticks_done, ticks_required, status, custom: dict = None):
+
+        if len(rows) == 0:
+            return
+
+        size = max(self._size, int(rows.max()) + 1)
+        if size > len(self.type_ids):
+            self._grow(max(size, len(self.type_ids) * 2))
+
+        self.type_ids[rows] = type_ids
+        self.ticks_done[rows] = ticks_done
+        self.ticks_required[rows] = ticks_required
+        self.updated[rows] = self.tick_count
+        self.status[rows] = numpy.where(status == CreationTable.STATUS_IN_PROGRESS,
+                                        CreationTable.STATUS_WAITING, status)
+
+        for row in rows.tolist():
+            self._custom.pop(row, None)
+
+        if custom is not None:
+            self._custom.update(custom)
+
+        self._size = size
+
+    # Work out which rows can be created given a mask of which catalog types can be created
+    def creatable_rows(self, creatable_mask, inventory: Inventory):
+
+        type_ids = self.type_ids[:self._size]
+        is_creatable = numpy.zeros(self._size, dtype=bool)
+
+        known = type_ids >= 0
+        is_creatable[known] = creatable_mask[type_ids[known]]
+
+        for row in self._custom.keys():
+            is_creatable[row] = inventory.is_creatable(self._custom[row])
+
+        return is_creatable
+
+
+class TickScheduler:
+    '''
+    Keeps the rows of a CreationTable that are in progress in a queue ordered by the tick that they will complete on,
+    so that the game can jump straight from one completion to the next instead of stepping every creation
+    through every tick.
+
+    A creation only progresses while the inventory has its pre-requisites.  The inventory doesn't change while
+    the game ticks, so which creations are progressing is only checked again when the inventory or the table has
+    changed.
+    '''
+
+    def __init__(self, creations: CreationTable):
+
+        self.creations = creations
+
+        # Queue of (completion tick, row) for the creations in progress
+        self._queue = []
+
+        self._inventory_version = None
+        self._table_size = 0
+
+    @property
+    def active_count(self):
+        creations = self.creations
+        return int(numpy.count_nonzero(creations.status[:len(creations)] == CreationTable.STATUS_IN_PROGRESS))
+
+    # Check which creations can make progress if the inventory or the table has changed since we last looked
+    def refresh(self, inventory: Inventory, creatables):
+
+        creations = self.creations
+        size = len(creations)
+
+        if inventory.version == self._inventory_version and size == self._table_size:
+            return
+
+        self._inventory_version = inventory.version
+        self._table_size = size
+
+        tick = creations.tick_count
+        is_creatable = creations.creatable_rows(creatables.get_creatable_mask(inventory), inventory)
+        status = creations.status[:size]
+
+        # Pause any creations that can no longer be created...
+        paused = numpy.flatnonzero((status == CreationTable.STATUS_IN_PROGRESS) & ~is_creatable)
+        creations.ticks_done[paused] += tick - creations.updated[paused]
+        creations.updated[paused] = tick
+        status[paused] = CreationTable.STATUS_WAITING
+
+        # ...and start any that now can be
+        started = numpy.flatnonzero((status == CreationTable.STATUS_WAITING) & is_creatable)
+        creations.updated[started] = tick
+        creations.completion[started] = tick + creations.ticks_required[started] - creations.ticks_done[started]
+        status[started] = CreationTable.STATUS_IN_PROGRESS
+
+        entries = zip(creations.completion[started].tolist(), started.tolist())
+        if len(started) > len(self._queue):
+            self._queue.extend(entries)
+            heapq.heapify(self._queue)
+        else:
+            for entry in entries:
+                heapq.heappush(self._queue, entry)
+
+    # Move the table on by the specified number of ticks.
+    # Returns the rows that completed in the order that they completed.
+    def advance(self, ticks: int, inventory: Inventory, creatables):
+
+        self.refresh(inventory, creatables)
+
+        creations = self.creations
+        end_tick = creations.tick_count + ticks
+        completed = []
+
+        while len(self._queue) > 0 and self._queue[0][0] <= end_tick:
+            completion_tick, row = heapq.heappop(self._queue)
+
+            # Skip anything that was paused after it was queued
+            if creations.status[row] != CreationTable.STATUS_IN_PROGRESS or \
+                    creations.completion[row] != completion_tick:
+                continue
+
+            creations.status[row] = CreationTable.STATUS_COMPLETE
+            creations.ticks_done[row] = creations.ticks_required[row]
+            completed.append(row)
+
+        creations.tick_count = end_tick
+
+        return completed
+
+
 class ResourceFactory:
-    resources = {}
+    '''
+    A catalog of resources loaded from a CSV file.  Each resource gets a dense id in the order it was added.
+    '''
 
     def __init__(self, file_name: str):
 
         self.file_name = file_name
+        self.resources = {}
 
-    @staticmethod
-    def get_resource(name: str):
+        # Resources in the order that they were given their ids
+        self.resource_list = []
+
+    def get_resource(self, name: str):
         resource = None
 
-        if name in ResourceFactory.resources.keys():
-            resource = ResourceFactory.resources[name]
+        if name in self.resources.keys():
+            resource = self.resources[name]
 
         return resource
 
-    @staticmethod
-    def get_resource_copy(name: str):
-        resource = None
+    def get_resource_id(self, name: str):
+        resource = self.resources.get(name)
 
-        if name in ResourceFactory.resources.keys():
-            resource = copy.deepcopy(ResourceFactory.resources[name])
+        if resource is None:
+            return -1
 
-        return resource
+        return resource.id
 
-    @staticmethod
-    def get_resource_types():
+    # Add a resource to the catalog giving it a dense id, keeping the old one if it is being reloaded
+    def add_resource(self, new_resource: Resource):
+
+        old_resource = self.resources.get(new_resource.name)
+        if old_resource is not None:
+            new_resource.id = old_resource.id
+        else:
+            new_resource.id = len(self.resource_list)
+            self.resource_list.append(new_resource)
+
+        self.resource_list[new_resource.id] = new_resource
+        self.resources[new_resource.name] = new_resource
 
-        return list(ResourceFactory.resources.keys())
+    def get_resource_by_id(self, resource_id: int):
+        return self.resource_list[resource_id]
 
-    def load(self):
+    def get_resource_count(self):
+        return len(self.resource_list)
+
+    # Resources don't hold any state of their own so everyone shares the one in the catalog
+    def get_resource_copy(self, name: str):
+        return self.resources.get(name)
+
+    def get_resource_types(self):
+
+        return list(self.resources.keys())
+
+    # Load the resources, printing each one if verbose
+    def load(self, verbose: bool = True):
 
         print("\nLoading resources...")
 
@@ -183,9 +640,10 @@ class ResourceFactory:
                     graphic = None
 
                 new_resource = Resource(name, description, category, graphic)
-                ResourceFactory.resources[new_resource.name] = new_resource
+                self.add_resource(new_resource)
 
-                print(str(new_resource))
+                if verbose is True:
+                    print(str(new_resource))
 
             # Close the file
             object_file.close()
@@ -198,11 +656,16 @@ class CreatableFactoryXML(object):
     Load some creatables from an XML file and store them in a dictionary
     '''
 
-    def __init__(self, file_name: str):
+    def __init__(self, file_name: str, resource_factory: ResourceFactory):
 
         self.file_name = file_name
-        self._dom = None
+        self.resource_factory = resource_factory
         self._creatables = {}
+        self._creatable_list = []
+        self._requirements = None
+
+        # Goes up every time the catalog is loaded so others know when to rebuild anything based on it
+        self.version = 0
 
     @property
     def count(self):
@@ -212,86 +675,89 @@ class CreatableFactoryXML(object):
     def names(self):
         return list(self._creatables.keys())
 
-    # Load in the quest contained in the quest file
-    def load(self):
+    # Load in the creatables contained in the creatables file, printing each one if verbose
+    def load(self, verbose: bool = True):
+
+        logging.info("%s.load(): Loading in %s", __class__, self.file_name)
 
-        self._dom = parse(self.file_name)
+        for new_creatable in self.iter_creatables():
+            if verbose is True:
+                print(str(new_creatable))
+            self.add_creatable(new_creatable)
 
-        assert self._dom.documentElement.tagName == "creatables"
+        print("\n{0} creatables loaded.".format(len(self._creatables)))
 
-        logging.info("%s.load(): Loading in %s", __class__, self.file_name)
+        self.loaded()
 
-        # Get a list of all quests
-        creatables = self._dom.getElementsByTagName("creatable")
+    # Add a creatable to the dictionary as a shared prototype giving it a dense id, keeping the old one if it is
+    # being reloaded
+    def add_creatable(self, new_creatable: Creatable):
 
-        # for each quest...
-        for creatable in creatables:
+        old_creatable = self._creatables.get(new_creatable.name)
+        if old_creatable is not None:
+            new_creatable.type_id = old_creatable.type_id
+        else:
+            new_creatable.type_id = len(self._creatable_list)
+            self._creatable_list.append(new_creatable)
 
-            # Get the main tags that describe the quest
-            name = self.xml_get_node_text(creatable, "name")
-            desc = self.xml_get_node_text(creatable, "description")
-            ticks_required = self.xml_get_node_value(creatable, "ticks_required")
+        self._creatable_list[new_creatable.type_id] = new_creatable
+        self._creatables[new_creatable.name] = new_creatable
+        new_creatable.freeze()
 
-            # ...and create a basic creatable object
-            new_creatable = Creatable(name=name, description=desc, ticks_required=ticks_required)
+    # Let everyone know that the catalog has changed
+    def loaded(self):
+        self._requirements = None
+        self.version += 1
 
-            logging.info("%s.load(): Loading Creatable '%s'...", __class__, new_creatable.name)
+    # Read the creatables file one creatable at a time, throwing away each element once it has been read
+    # so that memory doesn't grow with the size of the file
+    def iter_creatables(self):
 
-            # Next get a list of all of the pre-requisites
-            pre_requisites = creatable.getElementsByTagName("pre_requisites")[0]
-            resources = pre_requisites.getElementsByTagName("resource")
+        events = ElementTree.iterparse(self.file_name, events=("start", "end"))
 
-            # For each pre-requisite resource...
-            for resource in resources:
-                # Get the basic details of the resource
-                name = self.xml_get_node_text(resource, "name")
-                count = self.xml_get_node_value(resource, "count")
+        event, root = next(events)
+        assert root.tag == "creatables"
 
-                new_creatable.add_pre_requisite(name, count)
+        for event, element in events:
 
-                logging.info("{0}.load(): adding pre-req {1} ({2})".format(__class__, name, count))
+            if event != "end" or element.tag != "creatable":
+                continue
 
-            # Next get a list of all of the outputs
-            pre_requisites = creatable.getElementsByTagName("outputs")[0]
-            resources = pre_requisites.getElementsByTagName("resource")
+            # Get the main tags that describe the creatable and create a basic creatable object
+            new_creatable = Creatable(name=self.xml_get_node_text(element, "name"),
+                                      description=self.xml_get_node_text(element, "description"),
+                                      ticks_required=self.xml_get_node_value(element, "ticks_required"))
 
-            # For each output resource...
-            for resource in resources:
+            logging.info("%s.load(): Loading Creatable '%s'...", __class__, new_creatable.name)
 
-                # Get the basic details of the resource
+            # Add each of the pre-requisite resources...
+            for resource in element.iterfind("pre_requisites/resource"):
                 name = self.xml_get_node_text(resource, "name")
                 count = self.xml_get_node_value(resource, "count")
-                action = self.xml_get_node_text(resource, "action")
-                if action is not None:
-                    action = "replace"
-                else:
-                    action = "inventory"
+                new_creatable.add_pre_requisite(name, count)
+
+                logging.info("%s.load(): adding pre-req %s (%s)", __class__, name, count)
 
+            # ...and each of the output resources
+            for resource in element.iterfind("outputs/resource"):
+                name = self.xml_get_node_text(resource, "name")
+                count = self.xml_get_node_value(resource, "count")
                 new_creatable.add_output(name, count)
 
-                logging.info("{0}.load(): adding output {1} ({2})".format(__class__, name, count))
+                logging.info("%s.load(): adding output %s (%s)", __class__, name, count)
 
-            logging.info("{0}.load(): Creatable '{1}' loaded".format(__class__, new_creatable.name))
-            print(str(new_creatable))
+            logging.info("%s.load(): Creatable '%s' loaded", __class__, new_creatable.name)
 
-            # Add the new creatable to the dictionary
-            self._creatables[new_creatable.name] = new_creatable
+            # We are finished with the element so free it up
+            element.clear()
+            root.clear()
 
-        self._dom.unlink()
+            yield new_creatable
 
-    # From a specified node get the data value
+    # From a specified element get the text of the named child element
     def xml_get_node_text(self, node, tag_name: str):
 
-        tag = node.getElementsByTagName(tag_name)
-
-        # If the tag exists then get the data value
-        if len(tag) > 0:
-            value = tag[0].firstChild.data
-        # Else use None
-        else:
-            value = None
-
-        return value
+        return node.findtext(tag_name)
 
     def xml_get_node_value(self, node, tag_name: str):
 
@@ -307,142 +773,419 @@ class CreatableFactoryXML(object):
 
         return self._creatables[name]
 
+    def get_creatable_id(self, name: str):
+        creatable = self._creatables.get(name)
+
+        if creatable is None:
+            return -1
+
+        return creatable.type_id
+
+    def get_creatable_by_id(self, type_id: int):
+        return self._creatable_list[type_id]
+
+    # Get the pre-requisites of every creatable as a matrix with a row per creatable (its type_id) and a column
+    # per resource id.  Creatables that need a resource that doesn't exist can never be created.
+    def get_requirements_matrix(self):
+
+        resource_count = self.resource_factory.get_resource_count()
+
+        if self._requirements is None or self._requirements.shape != (self.count, resource_count):
+
+            self._requirements = numpy.zeros((self.count, resource_count), dtype=numpy.int64)
+
+            for creatable in self._creatables.values():
+                ids, counts = creatable.get_requirements(self.resource_factory)
+                if len(ids) > 0 and ids.min() < 0:
+                    self._requirements[creatable.type_id] = numpy.iinfo(numpy.int64).max
+                else:
+                    self._requirements[creatable.type_id, ids] = counts
+
+        return self._requirements
+
+    # Find out which of the creatables the inventory has enough resources for, indexed by type_id
+    def get_creatable_mask(self, inventory: Inventory):
+        return inventory.creatable_mask(self.get_requirements_matrix())
+
+    # Make a new creatable that shares its recipe with the catalog
     def get_creatable_copy(self, name: str):
-        return copy.deepcopy(self._creatables[name])
+        return CreatableInstance(self._creatables[name])
+
+
+class TilePalette:
+    '''
+    Maps the small integers stored for each map square onto the Resource that is on that square.
+    Index 0 is always an empty square.
+    '''
+
+    EMPTY = 0
+    MAX_SIZE = 256
+
+    def __init__(self):
+        self.resources = [None]
+        self._indexes = {}
+
+    def __len__(self):
+        return len(self.resources)
+
+    @property
+    def names(self):
+        return [resource.name for resource in self.resources[1:]]
+
+    # Get the index for a resource, adding it to the palette if it is not already in it
+    def index(self, resource: Resource):
+
+        if resource is None:
+            return TilePalette.EMPTY
+
+        index = self._indexes.get(resource.name)
+
+        if index is None:
+            if len(self.resources) >= TilePalette.MAX_SIZE:
+                raise Exception("Trying to add {0} to a tile palette that is already full!".format(resource.name))
+
+            index = len(self.resources)
+            self.resources.append(resource)
+            self._indexes[resource.name] = index
+
+        return index
+
+    def get(self, index: int):
+        return self.resources[index]
+
+
+class CatalogCache:
+    '''
+    A compiled copy of the resources and creatables catalogs that loads much faster than parsing the text files.
+    The cache records the size, modification time and hash of each source file and is only used while they match,
+    so it gets rebuilt automatically when a source file changes.
+    '''
+
+    MAGIC = "K2CATALOG1"
+
+    def __init__(self, file_name: str, source_files: list):
+        self.file_name = file_name
+        self.source_files = source_files
+
+    # Get the size, modification time and hash of a source file
+    @staticmethod
+    def source_key(file_name: str):
+        stat = os.stat(file_name)
+        with open(file_name, "rb") as source_file:
+            digest = hashlib.sha256(source_file.read()).hexdigest()
+        return (os.path.abspath(file_name), stat.st_size, stat.st_mtime_ns, digest)
+
+    # Check a recorded source key against the file, only hashing the file if its size or time has changed
+    @staticmethod
+    def is_current(key):
+        file_name, size, mtime, digest = key
+        try:
+            stat = os.stat(file_name)
+            if stat.st_size == size and stat.st_mtime_ns == mtime:
+                return True
+            return CatalogCache.source_key(file_name)[3] == digest
+        except OSError:
+            return False
+
+    # Load the catalogs from the cache.  Returns False if there is no up to date cache.
+    def load(self, resources: ResourceFactory, creatables):
+
+        try:
+            with open(self.file_name, "rb") as cache_file:
+                data = marshal.load(cache_file)
+        except (OSError, EOFError, ValueError, TypeError):
+            return False
+
+        if isinstance(data, dict) is False or data.get("magic") != CatalogCache.MAGIC:
+            return False
+
+        sources = [os.path.abspath(file_name) for file_name in self.source_files]
+        if [key[0] for key in data["sources"]] != sources:
+            return False
+
+        for key in data["sources"]:
+            if CatalogCache.is_current(key) is False:
+                logging.info("%s.load(): %s has changed", __class__, key[0])
+                return False
+
+        for name, description, category, graphic in data["resources"]:
+            resources.add_resource(Resource(name, description, category, graphic))
+
+        for name, description, ticks_required, pre_requisites, outputs in data["creatables"]:
+            new_creatable = Creatable(name=name, description=description, ticks_required=ticks_required)
+            for resource_name, count in pre_requisites:
+                new_creatable.add_pre_requisite(resource_name, count)
+            for resource_name, count in outputs:
+                new_creatable.add_output(resource_name, count)
+            creatables.add_creatable(new_creatable)
+
+        creatables.loaded()
+
+        print("\n{0} resources and {1} creatables loaded from {2}.".format(len(data["resources"]),
+                                                                        len(data["creatables"]),
+                                                                        self.file_name))
+        return True
+
+    # Save the loaded catalogs to the cache
+    def save(self, resources: ResourceFactory, creatables):
+
+        data = {
+            "magic": CatalogCache.MAGIC,
+            "sources": [CatalogCache.source_key(file_name) for file_name in self.source_files],
+            "resources": [(resource.name, resource.description, resource.category, resource.graphic)
+                          for resource in resources.resource_list],
+            "creatables": [(creatable.name, creatable.description, creatable.ticks_required,
+                            list(creatable.pre_requisites.items()), list(creatable.output.items()))
+                           for creatable in [creatables.get_creatable(name) for name in creatables.names]]
+        }
+
+        # Write to a temporary file first so that nobody ever sees half a cache
+        temp_file_name = self.file_name + ".tmp"
+        with open(temp_file_name, "wb") as cache_file:
+            marshal.dump(data, cache_file)
+        os.replace(temp_file_name, self.file_name)
+
+
+class MapPyramid:
+    '''
+    Mip-style levels of detail for a map, used to draw zoomed out views without touching every map square.
+    Level 0 is the map itself and each level after that halves the width and height, keeping the average altitude
+    and the dominant (most common non-empty) map square of each 2x2 block in the level below.
+    '''
+
+    def __init__(self, topo_model, tiles):
+
+        self.altitudes = [topo_model]
+        self.tiles = [tiles]
+
+        while max(self.altitudes[-1].shape) > 1:
+            self.altitudes.append(MapPyramid.downsample_altitudes(self.altitudes[-1]))
+            self.tiles.append(MapPyramid.downsample_tiles(self.tiles[-1]))
+
+    @property
+    def levels(self):
+        return len(self.altitudes)
+
+    # Get the four corners of each 2x2 block of an array, padding it if it has an odd size
+    @staticmethod
+    def blocks(a, pad_mode: str):
+
+        if a.shape[0] % 2 == 1 or a.shape[1] % 2 == 1:
+            a = numpy.pad(a, ((0, a.shape[0] % 2), (0, a.shape[1] % 2)), mode=pad_mode)
+
+        return a[0::2, 0::2], a[1::2, 0::2], a[0::2, 1::2], a[1::2, 1::2]
+
+    @staticmethod
+    def downsample_altitudes(a):
+
+        # Padding with the edge values means odd edges just average the squares that are there
+        north_west, north_east, south_west, south_east = MapPyramid.blocks(a, "edge")
+
+        return (north_west + north_east + south_west + south_east) / 4
+
+    @staticmethod
+    def downsample_tiles(a):
+
+        # Padding with empty squares means they never win
+        blocks = numpy.stack(MapPyramid.blocks(a, "constant"))
+
+        # Count how many times each corner's map square appears in its block, ignoring empty squares
+        counts = (blocks[:, None] == blocks[None, :]).sum(axis=1)
+        counts[blocks == TilePalette.EMPTY] = 0
+
+        return numpy.take_along_axis(blocks, counts.argmax(axis=0)[None], axis=0)[0]
+
+    # Update the levels above an area of map squares that has changed
+    def update_tiles(self, x: int, y: int, width: int = 1, height: int = 1):
+
+        x0, y0, x1, y1 = x, y, x + width, y + height
+
+        for level in range(1, self.levels):
+            x0 //= 2
+            y0 //= 2
+            x1 = (x1 + 1) // 2
+            y1 = (y1 + 1) // 2
+            self.tiles[level][x0:x1, y0:y1] = MapPyramid.downsample_tiles(
+                self.tiles[level - 1][x0 * 2:x1 * 2, y0 * 2:y1 * 2])
+
+
+class MapChangeTracker:
+    '''
+    Records which map squares have changed since it was last cleared.
+    Single squares are kept as (x, y) and bigger areas that changed in one go as (x, y, width, height).
+    '''
+
+    def __init__(self):
+        self.squares = set()
+        self.areas = []
+
+    @property
+    def is_empty(self):
+        return len(self.squares) == 0 and len(self.areas) == 0
+
+    def add(self, x: int, y: int, width: int = 1, height: int = 1):
+
+        if width == 1 and height == 1:
+            self.squares.add((x, y))
+        else:
+            self.areas.append((x, y, width, height))
+
+    def clear(self):
+        self.squares.clear()
+        self.areas.clear()
 
 
 class WorldMap:
     TILE_GRASS = "Grass"
     TILE_SEA = "Sea"
 
-    def __init__(self, name: str, width: int = 50, height: int = 50):
+    # World file layout: magic, header length, JSON header and then the topo and tile arrays on page boundaries
+    FILE_MAGIC = b"K2WORLD1"
+    FILE_HEADER_SIZE = 16384
+    FILE_ALIGNMENT = 4096
+    FILE_TOPO_DTYPE = "<f8"
+    FILE_TILES_DTYPE = "u1"
+
+    # Exports are done this many map squares at a time, with binary exports using magic, width, height and then rows
+    EXPORT_CHUNK_SIZE = 1 << 20
+    EXPORT_MAGIC = b"K2TOPO1\0"
+    EXPORT_DTYPE = "<f4"
+
+    # Change this whenever a change to world generation means a seed no longer gives the same world
+    GENERATOR_VERSION = 2
+
+    def __init__(self, name: str, width: int = 50, height: int = 50, seed: int = None,
+                 tile_size: int = None, workers: int = None, resource_factory: ResourceFactory = None):
         self.name = name
+
+        # The catalog of resources that can be put on the map
+        self.resource_factory = resource_factory
         self._width = width
         self._height = height
-        self.map = []
-        self.topo_model_pass2 = []
 
-    def initialise(self):
+        # If a tile size is specified then the topology is generated as seamless tiles spread across workers
+        self.tile_size = tile_size
+        self.workers = workers
 
-        # Generate a topology model for the map
-        self.generate_topology()
+        # The world is generated from its own seeded generator so the same seed always gives the same world
+        if seed is None:
+            seed = topography.new_seed()
 
-        # Clear the map squares
-        self.map = [[None for y in range(0, self._height)] for x in range(0, self._width)]
+        self.seed = seed
+        self.rng = numpy.random.default_rng(seed)
 
-        grass = ResourceFactory.get_resource_copy(WorldMap.TILE_GRASS)
-        self.add_objects(grass.graphic, 40)
+        # Map squares are kept as one palette index per square
+        self.palette = TilePalette()
+        self.tiles = None
 
-        grass = ResourceFactory.get_resource_copy(WorldMap.TILE_SEA)
-        self.add_objects(grass.graphic, 40)
+        # Altitudes are kept in a single (width, height) array for the life of the map
+        self.topo_model_pass2 = None
 
-    def generate_topology(self):
+        # Levels of detail for zoomed out views, built when they are first needed
+        self.pyramid = None
 
-        # Topo controls
-        MAX_ALTITUDE = 10.0
-        MIN_ALTITUDE_CLIP_FACTOR = -0.5
-        ALTITUDE_OFFSET = 0.0
-        MIN_ALTITUDE = 0.0
-        MAX_SLOPE = MAX_ALTITUDE * 0.15
-        MIN_SLOPE = MAX_SLOPE * -1.0
-        MAX_SLOPE_DELTA = MAX_SLOPE * 2.0
-
-        # Clear the topo model
-        topo_model_pass1 = [[None for y in range(0, self._height)] for x in range(0, self._width)]
-        self.topo_model_pass2 = [[None for y in range(0, self._height)] for x in range(0, self._width)]
-
-        # Create an initial topography using altitudes and random slope changes
-        print("Pass 1: altitudes and slopes...")
-
-        # Set the first square to be a random altitude with slopes in range
-        topo_model_pass1[0][0] = (random.uniform(MIN_ALTITUDE, MAX_ALTITUDE),
-                                  random.uniform(MIN_SLOPE, MAX_SLOPE),
-                                  random.uniform(MIN_SLOPE, MAX_SLOPE))
-
-        for y in range(0, self._height):
-            for x in range(0, self._width):
-                if y == 0:
-                    north_slope = random.uniform(MIN_SLOPE, MAX_SLOPE)
-                    north_altitude = random.uniform(MIN_ALTITUDE, MAX_ALTITUDE)
-                    # north_altitude = 0
-                else:
-                    north_altitude, tmp, north_slope = topo_model_pass1[x][y - 1]
+        # Anything that wants to know which map squares change
+        self._trackers = []
 
-                if x == 0:
-                    west_slope = random.uniform(MIN_SLOPE, MAX_SLOPE)
-                    west_altitude = random.uniform(MIN_ALTITUDE, MAX_ALTITUDE)
-                    # west_altitude = 0
-                else:
-                    west_altitude, west_slope, tmp = topo_model_pass1[x - 1][y]
+        # Function to call with progress messages while the map is being made instead of printing them
+        self.progress = None
+
+    # Report how making the map is getting on
+    def report(self, message: str):
+        if self.progress is not None:
+            self.progress(message)
+        else:
+            print(message)
+
+    # A key that identifies everything that the generated world depends on
+    @property
+    def generation_key(self):
+
+        key = "{0}_{1}x{2}_v{3}".format(self.seed, self._width, self._height, WorldMap.GENERATOR_VERSION)
 
-                clip = lambda n, minn, maxn: max(min(maxn, n), minn)
+        # Tiled worlds come out differently to ones generated in one go
+        if self.tile_size is not None:
+            key += "_t{0}".format(self.tile_size)
 
-                altitude = ((north_altitude + north_slope) + (west_altitude + west_slope)) / 2
-                altitude = clip(altitude, MIN_ALTITUDE, MAX_ALTITUDE)
+        return key
 
-                east_slope = west_slope + ((random.random() * MAX_SLOPE_DELTA) - MAX_SLOPE_DELTA / 2)
-                east_slope = clip(east_slope, MIN_SLOPE, MAX_SLOPE)
+    def initialise(self, cache_dir: str = None):
 
-                south_slope = north_slope + ((random.random() * MAX_SLOPE_DELTA) - MAX_SLOPE_DELTA / 2)
-                south_slope = clip(south_slope, MIN_SLOPE, MAX_SLOPE)
+        # If we have already generated this world then open the cached copy instead.
+        # Open it copy-on-write so that changes to this map don't end up in the cache.
+        if cache_dir is not None:
+            cache_file = os.path.join(cache_dir, "world_{0}.k2w".format(self.generation_key))
+            if os.path.exists(cache_file) is True:
+                self.load(cache_file, mode="c")
+                self.build_pyramid()
+                return
+
+        self.rng = numpy.random.default_rng(self.seed)
+
+        # Generate a topology model for the map
+        self.generate_topology()
 
-                topo_model_pass1[x][y] = (altitude, east_slope, south_slope)
+        # Clear the map squares
+        self.tiles = numpy.zeros((self._width, self._height), dtype=numpy.uint8)
 
-        print("Pass 2: averaging out using neighbouring points...")
+        grass = self.resource_factory.get_resource(WorldMap.TILE_GRASS)
+        self.add_objects(grass, 40)
 
-        # Perform second pass averaging based on adjacent altitudes to smooth out topography
-        # Define which neighboring points we are going to look at
-        vectors = ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, -1), (1, -1), (-1, 1))
+        sea = self.resource_factory.get_resource(WorldMap.TILE_SEA)
+        self.add_objects(sea, 40)
 
-        # Iterate through each point in the map
-        for y in range(0, self._height):
-            for x in range(0, self._width):
+        self.build_pyramid()
 
-                # Get the height of the current point
-                local_altitude_total, es, ss = topo_model_pass1[x][y]
-                local_altitude_points = 1
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            self.save(cache_file)
 
-                # Get the heights of the surrounding points
-                for dx, dy in vectors:
-                    if x + dx < 0 or x + dx >= self._width or y + dy < 0 or y + dy >= self._height:
-                        pass
-                    else:
-                        local_altitude, es, ss = topo_model_pass1[x + dx][y + dy]
-                        local_altitude_total += local_altitude
-                        local_altitude_points += 1
+    def generate_topology(self):
 
-                average_altitude = (local_altitude_total / local_altitude_points)
+        if self.tile_size is not None:
+            altitudes = self.generate_tiled_topology()
+        else:
+            # Create an initial topography using altitudes and random slope changes
+            self.report("Pass 1: altitudes and slopes...")
+            altitudes = topography.generate_altitudes(self._width, self._height, self.rng)
 
-                # Record the average altitude in a new array
-                self.topo_model_pass2[x][y] = average_altitude
+            # Perform second pass averaging based on adjacent altitudes to smooth out topography
+            self.report("Pass 2: averaging out using neighbouring points...")
+            altitudes = topography.smooth(altitudes)
 
         # Perform 3rd pass clipping to create floors in the topology
-        a = numpy.array(self.topo_model_pass2)
-        avg = numpy.mean(a)
-        std = numpy.std(a)
-        threshold = avg - (std * MIN_ALTITUDE_CLIP_FACTOR)
-        a[a < threshold] = threshold
-        self.topo_model_pass2 = a.tolist()
+        threshold = topography.apply_floor(altitudes)
+        self.topo_model_pass2 = altitudes
+
+        self.report("Pass 3: applying altitude floor of {0:.3}...".format(threshold))
+
+    # Generate passes 1 and 2 as seamless tiles in a pool of worker processes.
+    # Pass 3 still needs the whole map so it gets done afterwards in the usual way.
+    def generate_tiled_topology(self):
+
+        workers = self.workers
+        if workers is None:
+            workers = os.cpu_count() or 1
 
-        print("Pass 3: applying altitude floor of {0:.3}...".format(threshold))
+        self.report("Pass 1 and 2: generating {0}x{0} tiles using {1} worker(s)...".format(self.tile_size, workers))
+
+        if workers <= 1:
+            return topography.generate_tiled(self.seed, self._width, self._height, self.tile_size)
+
+        with futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            return topography.generate_tiled(self.seed, self._width, self._height, self.tile_size, executor)
 
     @property
     def width(self):
-        return len(self.map)
+        return self._width
 
     @property
     def height(self):
-        return len(self.map[0])
+        return self._height
 
     # Are the specified coordinates within the area of the map?
     def is_valid_xy(self, x: int, y: int):
-
-        result = False
-
-        if x >= 0 and x < self.width and y >= 0 and y < self.height:
-            result = True
-
-        return result
+        return 0 <= x < self._width and 0 <= y < self._height
 
     # Get a map square at the specified co-ordinates
     def get(self, x: int, y: int):
@@ -450,35 +1193,544 @@ class WorldMap:
         if self.is_valid_xy(x, y) is False:
             raise Exception("Trying to get tile at ({0},{1}) which is outside of the world!".format(x, y))
 
-        return self.map[x][y]
+        return self.palette.resources[self.tiles[x, y]]
+
+    # Get a map square without checking the co-ordinates, for use in loops that have already checked them
+    def get_unchecked(self, x: int, y: int):
+        return self.palette.resources[self.tiles[x, y]]
+
+    # Get the palette indexes of the map squares in the specified area as a read-only view
+    def get_tile_range(self, x: int, y: int, width: int, height: int):
+
+        a = self.tiles[x:x + width, y:y + height]
+        a.flags.writeable = False
 
-    def get_range(self, x: int, y: int, width: int, height: int):
+        return a
 
-        a = numpy.array(self.topo_model_pass2, order="F")
-        b = a[x:x + width, y:y + height]
+    # Get the altitudes in the specified area as a read-only view of the topo model or optionally as a list of lists
+    def get_range(self, x: int, y: int, width: int, height: int, as_list: bool = False):
 
-        return b.tolist()
+        a = self.topo_model_pass2[x:x + width, y:y + height]
+
+        if as_list is True:
+            return a.tolist()
+
+        a.flags.writeable = False
+
+        return a
 
     # Set a map square at the specified co-ordinates with the specified object
-    def set(self, x: int, y: int, c):
+    def set(self, x: int, y: int, c: Resource):
 
         if self.is_valid_xy(x, y) is False:
             raise Exception("Trying to set tile at ({0},{1}) which is outside of the world!".format(x, y))
 
-        self.map[x][y] = c
+        self.tiles[x, y] = self.palette.index(c)
+        self.changed(x, y)
+
+    # Set a map square without checking the co-ordinates, for use in loops that have already checked them
+    def set_unchecked(self, x: int, y: int, c: Resource):
+        self.tiles[x, y] = self.palette.index(c)
+        self.changed(x, y)
+
+    # Fill the specified area of the map with the specified object
+    def fill(self, x: int, y: int, width: int, height: int, c: Resource):
+
+        if self.is_valid_xy(x, y) is False or self.is_valid_xy(x + width - 1, y + height - 1) is False:
+            raise Exception("Trying to fill tiles ({0},{1}) to ({2},{3}) which are outside of the world!".format(
+                x, y, x + width - 1, y + height - 1))
+
+        self.tiles[x:x + width, y:y + height] = self.palette.index(c)
+        self.changed(x, y, width, height)
 
     def get_altitude(self, x: int, y: int):
-        return self.topo_model_pass2[x][y]
+        return float(self.topo_model_pass2[x, y])
 
     # Add objects to random tiles
-    def add_objects(self, object_type, count: int = 20):
+    def add_objects(self, object_type: Resource, count: int = 20):
+
+        xs = self.rng.integers(0, self.width, count)
+        ys = self.rng.integers(0, self.height, count)
+
+        # Only fill the squares that are empty
+        empty = self.tiles[xs, ys] == TilePalette.EMPTY
+        self.tiles[xs[empty], ys[empty]] = self.palette.index(object_type)
+
+        if self.pyramid is not None or len(self._trackers) > 0:
+            for x, y in zip(xs[empty].tolist(), ys[empty].tolist()):
+                self.changed(x, y)
+
+    # Let the levels of detail and anything tracking changes know that an area of map squares has changed
+    def changed(self, x: int, y: int, width: int = 1, height: int = 1):
+
+        if self.pyramid is not None:
+            self.pyramid.update_tiles(x, y, width, height)
+
+        for tracker in self._trackers:
+            tracker.add(x, y, width, height)
+
+    # Start recording which map squares change
+    def track_changes(self):
+
+        tracker = MapChangeTracker()
+        self._trackers.append(tracker)
+
+        return tracker
+
+    def stop_tracking(self, tracker: MapChangeTracker):
+
+        if tracker in self._trackers:
+            self._trackers.remove(tracker)
+
+    # Build the levels of detail used for zoomed out views of the map
+    def build_pyramid(self):
+        self.pyramid = MapPyramid(self.topo_model_pass2, self.tiles)
+
+    def get_pyramid(self):
+
+        if self.pyramid is None:
+            self.build_pyramid()
+
+        return self.pyramid
+
+    # The number of levels of detail, with the last one being a single square
+    @property
+    def lod_levels(self):
+
+        levels = 1
+        size = max(self.width, self.height)
+        while size > 1:
+            size = -(-size // 2)
+            levels += 1
+
+        return levels
+
+    # Check that a level of detail exists for the map
+    def check_lod_level(self, level: int):
+
+        if isinstance(level, int) is False or level < 0 or level >= self.lod_levels:
+            raise Exception("Level of detail {0} is not valid: pick a whole number from 0 to {1}".format(
+                level, self.lod_levels - 1))
+
+    # Get the width and height of the map at the specified level of detail
+    def get_lod_size(self, level: int):
+
+        self.check_lod_level(level)
+
+        if level == 0:
+            return self._width, self._height
+
+        return self.get_pyramid().altitudes[level].shape
+
+    # Get the average altitudes in an area of the map at the specified level of detail as a read-only view.
+    # Co-ordinates are at the level of detail so each one covers 2^level map squares in each direction.
+    def get_lod_range(self, level: int, x: int, y: int, width: int, height: int):
+
+        self.check_lod_level(level)
+
+        if level == 0:
+            return self.get_range(x, y, width, height)
+
+        a = self.get_pyramid().altitudes[level][x:x + width, y:y + height]
+        a.flags.writeable = False
+
+        return a
+
+    # Get the palette indexes of the dominant map squares in an area at the specified level of detail
+    def get_lod_tile_range(self, level: int, x: int, y: int, width: int, height: int):
+
+        self.check_lod_level(level)
+
+        if level == 0:
+            return self.get_tile_range(x, y, width, height)
+
+        a = self.get_pyramid().tiles[level][x:x + width, y:y + height]
+        a.flags.writeable = False
+
+        return a
+
+    # Save the topo model and map squares to a binary world file
+    def save(self, file_name: str):
+
+        topo_offset = WorldMap.align(len(WorldMap.FILE_MAGIC) + WorldMap.FILE_HEADER_SIZE)
+        tiles_offset = WorldMap.align(topo_offset + self._width * self._height *
+                                      numpy.dtype(WorldMap.FILE_TOPO_DTYPE).itemsize)
+
+        with open(file_name, "wb") as world_file:
+            self.write_header(world_file, topo_offset, tiles_offset)
+
+            world_file.seek(topo_offset)
+            world_file.write(numpy.ascontiguousarray(self.topo_model_pass2, dtype=WorldMap.FILE_TOPO_DTYPE).data)
+
+            world_file.seek(tiles_offset)
+            world_file.write(numpy.ascontiguousarray(self.tiles, dtype=WorldMap.FILE_TILES_DTYPE).data)
+
+        logging.info("%s.save(): Saved %s to %s", __class__, self.name, file_name)
+
+    def write_header(self, world_file, topo_offset: int, tiles_offset: int):
 
-        for i in range(0, count):
-            x = random.randint(0, self.width - 1)
-            y = random.randint(0, self.height - 1)
+        header = json.dumps({"name": self.name,
+                             "seed": self.seed,
+                             "width": self._width,
+                             "height": self._height,
+                             "palette": self.palette.names,
+                             "topo_offset": topo_offset,
+                             "tiles_offset": tiles_offset}).encode("utf-8")
+
+        if len(header) + 4 > WorldMap.FILE_HEADER_SIZE:
+            raise Exception("World file header for {0} is too big ({1} bytes)!".format(self.name, len(header)))
+
+        world_file.seek(0)
+        world_file.write(WorldMap.FILE_MAGIC)
+        world_file.write(len(header).to_bytes(4, "little"))
+        world_file.write(header)
+
+    # Open a world file memory-mapped so that only the areas that get used are read from disk.
+    # Mode "r" is read-only and can be shared between processes, "r+" writes changes back to the file and
+    # "c" keeps changes in memory only.
+    def load(self, file_name: str, mode: str = "r"):
+
+        self.pyramid = None
+
+        with open(file_name, "rb") as world_file:
+            if world_file.read(len(WorldMap.FILE_MAGIC)) != WorldMap.FILE_MAGIC:
+                raise Exception("{0} is not a world file!".format(file_name))
+
+            header_size = int.from_bytes(world_file.read(4), "little")
+            header = json.loads(world_file.read(header_size).decode("utf-8"))
+
+        self.name = header["name"]
+        self.seed = header["seed"]
+        self._width = header["width"]
+        self._height = header["height"]
+
+        self.palette = TilePalette()
+        for resource_name in header["palette"]:
+            resource = self.resource_factory.get_resource(resource_name)
+            if resource is None:
+                raise Exception("World file {0} uses unknown resource {1}!".format(file_name, resource_name))
+            self.palette.index(resource)
+
+        shape = (self._width, self._height)
+        self.topo_model_pass2 = numpy.memmap(file_name, dtype=WorldMap.FILE_TOPO_DTYPE, mode=mode,
+                                             offset=header["topo_offset"], shape=shape)
+        self.tiles = numpy.memmap(file_name, dtype=WorldMap.FILE_TILES_DTYPE, mode=mode,
+                                  offset=header["tiles_offset"], shape=shape)
+
+        logging.info("%s.load(): Opened %s (%ix%i) from %s", __class__, self.name, self._width, self._height,
+                     file_name)
+
+    # Export the altitudes of the map or the area of it in rect (x, y, width, height) to a file.
+    # The format comes from the file extension: ".csv" for text, ".npy" for a numpy array or anything else for
+    # a compact binary file of float32 values with a small header.  Whichever format is used the rows of the file
+    # are the rows of the map, and they are written a few at a time so memory use stays the same for any size.
+    def export_topology(self, file_name: str, rect: list = None):
+
+        if rect is not None:
+            ox, oy, width, height = rect
+        else:
+            ox = 0
+            oy = 0
+            width = self.width
+            height = self.height
+
+        if any(isinstance(value, (int, numpy.integer)) is False for value in (ox, oy, width, height)):
+            raise Exception("Trying to export altitudes from {0} which is not 4 whole numbers!".format(rect))
+
+        if width < 1 or height < 1:
+            raise Exception("Trying to export {0}x{1} altitudes which is not at least 1x1!".format(width, height))
+
+        if self.is_valid_xy(ox, oy) is False or self.is_valid_xy(ox + width - 1, oy + height - 1) is False:
+            raise Exception("Trying to export altitudes ({0},{1}) to ({2},{3}) which are outside of the world!".format(
+                ox, oy, ox + width - 1, oy + height - 1))
+
+        extension = os.path.splitext(file_name)[1].lower()
+        rows_per_chunk = max(1, WorldMap.EXPORT_CHUNK_SIZE // width)
+
+        with open(file_name, "wb") as export_file:
+
+            if extension == ".csv":
+                export_file.write(("," + ",".join(str(x) for x in range(ox, ox + width)) + "\n").encode("utf-8"))
+                row_format = ["%d"] + ["%.4g"] * width
+            elif extension == ".npy":
+                numpy.lib.format.write_array_header_1_0(export_file, {"descr": WorldMap.FILE_TOPO_DTYPE,
+                                                                      "fortran_order": False,
+                                                                      "shape": (height, width)})
+            else:
+                export_file.write(WorldMap.EXPORT_MAGIC)
+                export_file.write(numpy.array([width, height], dtype="<u4").tobytes())
+
+            for y in range(oy, oy + height, rows_per_chunk):
+                rows = min(rows_per_chunk, oy + height - y)
+                altitudes = self.get_range(ox, y, width, rows).T
+
+                if extension == ".csv":
+                    labels = numpy.arange(y, y + rows).reshape(-1, 1)
+                    numpy.savetxt(export_file, numpy.hstack((labels, altitudes)), fmt=row_format, delimiter=",")
+                elif extension == ".npy":
+                    export_file.write(numpy.ascontiguousarray(altitudes, dtype=WorldMap.FILE_TOPO_DTYPE).data)
+                else:
+                    export_file.write(numpy.ascontiguousarray(altitudes, dtype=WorldMap.EXPORT_DTYPE).data)
+
+        logging.info("%s.export_topology(): Exported (%i,%i) %ix%i to %s", __class__, ox, oy, width, height,
+                     file_name)
+
+    # Write any changes back to a world file that was opened with mode "r+"
+    def flush(self):
+
+        if isinstance(self.tiles, numpy.memmap) is False or self.tiles.mode != "r+":
+            return
+
+        self.topo_model_pass2.flush()
+        self.tiles.flush()
+
+        # New objects may have been added to the palette
+        with open(self.tiles.filename, "r+b") as world_file:
+            self.write_header(world_file, self.topo_model_pass2.offset, self.tiles.offset)
+
+    @staticmethod
+    def align(offset: int):
+        return -(-offset // WorldMap.FILE_ALIGNMENT) * WorldMap.FILE_ALIGNMENT
+
+
+class WorldChunk:
+    '''
+    A square section of a chunked world with its own topography and map squares
+    '''
+
+    def __init__(self, x: int, y: int, topo_model, tiles):
+        self.x = x
+        self.y = y
+        self.topo_model = topo_model
+        self.tiles = tiles
+
+
+class ChunkedWorldMap(WorldMap):
+    '''
+    A world with no edges that is generated a chunk at a time as it gets explored.
+
+    Each chunk is seeded from the world seed and its chunk coordinates so it always regenerates identically
+    and its edges line up with its neighbours.  Only the most recently used chunks are kept in memory, and the
+    map squares of any chunk that has been changed are kept separately so that they survive it being evicted.
+    Width and height are the size of the default view of the world starting at (0,0).
+    '''
+
+    DEFAULT_CHUNK_SIZE = 64
+    DEFAULT_MAX_CHUNKS = 256
+
+    # Objects per map square added to each new chunk
+    OBJECT_DENSITY = 40 / (50 * 50)
+
+    def __init__(self, name: str, width: int = 50, height: int = 50, seed: int = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, max_chunks: int = DEFAULT_MAX_CHUNKS,
+                 resource_factory: ResourceFactory = None):
+
+        super(ChunkedWorldMap, self).__init__(name, width, height, seed, resource_factory=resource_factory)
+
+        self.chunk_size = chunk_size
+        self.max_chunks = max_chunks
+        self.floor = None
+        self._chunks = collections.OrderedDict()
+        self._edited_tiles = {}
+
+    def initialise(self, cache_dir: str = None):
+
+        self.rng = numpy.random.default_rng(self.seed)
+        self._chunks.clear()
+        self._edited_tiles.clear()
+
+        # The altitude floor has to be the same in every chunk so base it on the chunk at the origin
+        altitudes = topography.generate_chunk(self.seed, 0, 0, self.chunk_size, self.chunk_size)
+        self.floor = topography.floor_threshold(altitudes)
+
+        self.report("Chunked world seed {0}: {1}x{1} chunks with an altitude floor of {2:.3}...".format(self.seed,
+                                                                                                     self.chunk_size,
+                                                                                                     self.floor))
+
+    @property
+    def chunk_count(self):
+        return len(self._chunks)
+
+    # Every square exists in a world with no edges
+    def is_valid_xy(self, x: int, y: int):
+        return True
+
+    # Get the chunk with the specified chunk co-ordinates, generating it if it is not in memory
+    def get_chunk(self, cx: int, cy: int):
+
+        key = (cx, cy)
+        chunk = self._chunks.get(key)
+
+        if chunk is None:
+            chunk = self.generate_chunk(cx, cy)
+            self._chunks[key] = chunk
+
+            # Evict the least recently used chunk if we have too many
+            if len(self._chunks) > self.max_chunks:
+                self._chunks.popitem(last=False)
+        else:
+            self._chunks.move_to_end(key)
+
+        return chunk
+
+    def generate_chunk(self, cx: int, cy: int):
+
+        if self.floor is None:
+            raise Exception("Trying to generate chunk ({0},{1}) before the world has been initialised!".format(cx, cy))
+
+        size = self.chunk_size
+
+        altitudes = topography.generate_chunk(self.seed, cx, cy, size, size)
+        topography.apply_floor(altitudes, self.floor)
+
+        # If the chunk has been changed since it was first generated then put back its map squares
+        tiles = self._edited_tiles.get((cx, cy))
+
+        if tiles is None:
+            tiles = numpy.zeros((size, size), dtype=numpy.uint8)
+
+            # Scatter objects using the chunk's own generator so they come back in the same places
+            rng = topography.seeded_rng(self.seed, topography.STREAM_OBJECTS, cx, cy)
+            count = int(round(size * size * ChunkedWorldMap.OBJECT_DENSITY))
+            for tile_name in (WorldMap.TILE_GRASS, WorldMap.TILE_SEA):
+                xs, ys = rng.integers(0, size, (2, count))
+                empty = tiles[xs, ys] == TilePalette.EMPTY
+                tiles[xs[empty], ys[empty]] = self.palette.index(self.resource_factory.get_resource(tile_name))
+
+        return WorldChunk(cx, cy, altitudes, tiles)
+
+    # Get the chunk for a set of map co-ordinates ready to be changed
+    def get_edited_chunk(self, cx: int, cy: int):
+
+        chunk = self.get_chunk(cx, cy)
+        self._edited_tiles[(cx, cy)] = chunk.tiles
+
+        return chunk
+
+    def get(self, x: int, y: int):
+        cx, lx = divmod(x, self.chunk_size)
+        cy, ly = divmod(y, self.chunk_size)
+
+        return self.palette.resources[self.get_chunk(cx, cy).tiles[lx, ly]]
+
+    def get_unchecked(self, x: int, y: int):
+        return self.get(x, y)
+
+    def set(self, x: int, y: int, c: Resource):
+        cx, lx = divmod(x, self.chunk_size)
+        cy, ly = divmod(y, self.chunk_size)
+
+        self.get_edited_chunk(cx, cy).tiles[lx, ly] = self.palette.index(c)
+        self.changed(x, y)
+
+    def set_unchecked(self, x: int, y: int, c: Resource):
+        self.set(x, y, c)
+
+    def fill(self, x: int, y: int, width: int, height: int, c: Resource):
+
+        index = self.palette.index(c)
+
+        for chunk, (x0, x1, y0, y1), (lx0, lx1, ly0, ly1) in self.chunks_in_range(x, y, width, height):
+            self.get_edited_chunk(chunk.x, chunk.y).tiles[lx0:lx1, ly0:ly1] = index
+
+        self.changed(x, y, width, height)
+
+    def get_altitude(self, x: int, y: int):
+        cx, lx = divmod(x, self.chunk_size)
+        cy, ly = divmod(y, self.chunk_size)
+
+        return float(self.get_chunk(cx, cy).topo_model[lx, ly])
+
+    # Get each chunk that overlaps the specified area along with the overlap in map and in chunk co-ordinates
+    def chunks_in_range(self, x: int, y: int, width: int, height: int):
+
+        size = self.chunk_size
+
+        for cx in range(x // size, (x + width - 1) // size + 1):
+            x0 = max(x, cx * size)
+            x1 = min(x + width, (cx + 1) * size)
+            for cy in range(y // size, (y + height - 1) // size + 1):
+                y0 = max(y, cy * size)
+                y1 = min(y + height, (cy + 1) * size)
+                yield self.get_chunk(cx, cy), (x0, x1, y0, y1), \
+                      (x0 - cx * size, x1 - cx * size, y0 - cy * size, y1 - cy * size)
+
+    # A range can span several chunks so it gets copied into a new array rather than being a view
+    def get_range(self, x: int, y: int, width: int, height: int, as_list: bool = False):
+
+        a = numpy.empty((width, height))
+
+        for chunk, (x0, x1, y0, y1), (lx0, lx1, ly0, ly1) in self.chunks_in_range(x, y, width, height):
+            a[x0 - x:x1 - x, y0 - y:y1 - y] = chunk.topo_model[lx0:lx1, ly0:ly1]
+
+        if as_list is True:
+            return a.tolist()
+
+        a.flags.writeable = False
+
+        return a
+
+    def get_tile_range(self, x: int, y: int, width: int, height: int):
+
+        a = numpy.empty((width, height), dtype=numpy.uint8)
+
+        for chunk, (x0, x1, y0, y1), (lx0, lx1, ly0, ly1) in self.chunks_in_range(x, y, width, height):
+            a[x0 - x:x1 - x, y0 - y:y1 - y] = chunk.tiles[lx0:lx1, ly0:ly1]
+
+        a.flags.writeable = False
+
+        return a
+
+    # Add objects to random tiles in the default view
+    def add_objects(self, object_type: Resource, count: int = 20):
+
+        for x, y in zip(self.rng.integers(0, self.width, count), self.rng.integers(0, self.height, count)):
             if self.get(x, y) is None:
                 self.set(x, y, object_type)
 
+    def build_pyramid(self):
+        pass
+
+    def get_lod_size(self, level: int):
+        self.check_lod_level(level)
+        return -(-self.width // 2 ** level), -(-self.height // 2 ** level)
+
+    # Chunks come and go so zoomed out views are worked out from the squares they cover when they are needed
+    def get_lod_range(self, level: int, x: int, y: int, width: int, height: int):
+
+        self.check_lod_level(level)
+
+        scale = 2 ** level
+        a = self.get_range(x * scale, y * scale, width * scale, height * scale)
+
+        for i in range(0, level):
+            a = MapPyramid.downsample_altitudes(a)
+
+        a.flags.writeable = False
+
+        return a
+
+    def get_lod_tile_range(self, level: int, x: int, y: int, width: int, height: int):
+
+        self.check_lod_level(level)
+
+        scale = 2 ** level
+        a = self.get_tile_range(x * scale, y * scale, width * scale, height * scale)
+
+        for i in range(0, level):
+            a = MapPyramid.downsample_tiles(a)
+
+        a.flags.writeable = False
+
+        return a
+
+    def save(self, file_name: str):
+        raise Exception("Chunked world {0} is regenerated from its seed and can't be saved to a world file!".format(
+            self.name))
+
+    def load(self, file_name: str, mode: str = "r"):
+        raise Exception("Chunked world {0} can't be loaded from a world file!".format(self.name))
+
 
 class MapSquare:
 
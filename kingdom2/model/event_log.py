@@ -0,0 +1,174 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from .utils import Event
+from .utils import EventBus
+
+
+class EventLogSink:
+    '''
+    Writes events to a JSON lines file from a background thread so that publishing an event only costs putting it
+    on a queue.  The writer takes events off the queue in batches and starts a new file when the current one gets
+    too big.  If the writer falls behind and the queue fills up then events either wait or get dropped.
+    '''
+
+    # What to do with an event when the backlog is full
+    POLICY_BLOCK = "block"
+    POLICY_DROP = "drop"
+
+    DEFAULT_MAX_BACKLOG = 10000
+    DEFAULT_BATCH_SIZE = 500
+    DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+    DEFAULT_BACKUP_COUNT = 5
+
+    def __init__(self, file_name: str, policy: str = POLICY_DROP, max_backlog: int = DEFAULT_MAX_BACKLOG,
+                 batch_size: int = DEFAULT_BATCH_SIZE, max_bytes: int = DEFAULT_MAX_BYTES,
+                 backup_count: int = DEFAULT_BACKUP_COUNT):
+
+        if policy not in (EventLogSink.POLICY_BLOCK, EventLogSink.POLICY_DROP):
+            raise Exception("Unknown event log policy {0}!".format(policy))
+
+        self.file_name = file_name
+        self.policy = policy
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+
+        self.dropped = 0
+        self.written = 0
+
+        self._queue = queue.Queue(maxsize=max_backlog)
+        self._file = None
+        self._size = 0
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._run, name="event-log", daemon=True)
+        self._thread.start()
+
+    # Start and stop logging the events published on a bus
+    def attach(self, bus: EventBus):
+        bus.subscribe(EventBus.ALL, self.write)
+
+    def detach(self, bus: EventBus):
+        bus.unsubscribe(EventBus.ALL, self.write)
+
+    # Queue up an event to be written
+    def write(self, event: Event):
+
+        if self._closed is True:
+            return
+
+        record = (time.time(), event)
+
+        if self.policy == EventLogSink.POLICY_BLOCK:
+            self._queue.put(record)
+        else:
+            try:
+                self._queue.put_nowait(record)
+            except queue.Full:
+                self.dropped += 1
+
+    # Write everything that is still queued and stop the writer
+    def close(self):
+
+        if self._closed is True:
+            return
+
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    @staticmethod
+    def to_json(record):
+        event_time, event = record
+        return json.dumps({"time": event_time,
+                           "name": event.name,
+                           "type": event.type,
+                           "description": event.description,
+                           "count": event.count}, default=str)
+
+    def _run(self):
+
+        stopping = False
+
+        while stopping is False:
+
+            # Wait for something to write and then take whatever else is waiting, up to the batch size
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if None in batch:
+                stopping = True
+                batch = [record for record in batch if record is not None]
+
+            try:
+                self._write_lines([EventLogSink.to_json(record) for record in batch])
+                self.written += len(batch)
+            except Exception as err:
+                logging.error("%s: unable to write %d events to %s: %s", __class__, len(batch), self.file_name, err)
+
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    # Write out lines, starting a new file whenever the next line would take the current one over the size limit.
+    # A line that is bigger than the limit on its own still gets written, in a file of its own.
+    def _write_lines(self, lines: list):
+
+        if len(lines) == 0:
+            return
+
+        if self._file is None:
+            self._file = open(self.file_name, "ab")
+            self._size = self._file.tell()
+
+        pending = []
+        pending_size = 0
+
+        for line in lines:
+            data = (line + "\n").encode("utf-8")
+
+            if self._size + pending_size > 0 and self._size + pending_size + len(data) > self.max_bytes:
+                self._write_data(pending, pending_size)
+                pending = []
+                pending_size = 0
+                self.rotate()
+
+            pending.append(data)
+            pending_size += len(data)
+
+        self._write_data(pending, pending_size)
+
+    def _write_data(self, data: list, size: int):
+
+        if size == 0:
+            return
+
+        self._file.write(b"".join(data))
+        self._file.flush()
+        self._size += size
+
+    # Move the current file to .1, .1 to .2 and so on, throwing away the oldest, and start a new file
+    def rotate(self):
+
+        self._file.close()
+
+        if self.backup_count > 0:
+            for i in range(self.backup_count - 1, 0, -1):
+                old_name = "{0}.{1}".format(self.file_name, i)
+                if os.path.exists(old_name) is True:
+                    os.replace(old_name, "{0}.{1}".format(self.file_name, i + 1))
+            os.replace(self.file_name, self.file_name + ".1")
+        else:
+            os.remove(self.file_name)
+
+        self._file = open(self.file_name, "ab")
+        self._size = 0
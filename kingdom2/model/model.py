@@ -1,13 +1,83 @@
 import logging
 import os
+import random
+import threading
 from .utils import Event
-from .utils import EventQueue
+from .utils import EventBus
+from .utils import lazy_import
 from .building_blocks import Resource
 from .building_blocks import Inventory
 from .building_blocks import Creatable
+from .building_blocks import CreatableInstance
 from .building_blocks import ResourceFactory
 from .building_blocks import CreatableFactoryXML
+from .building_blocks import CatalogCache
 from .building_blocks import WorldMap
+from .building_blocks import ChunkedWorldMap
+from .building_blocks import TilePalette
+from .building_blocks import TickScheduler
+from .building_blocks import CreationTable
+from .building_blocks import Creation
+from .planner import ProductionPlanner
+from .snapshot import GameSaver
+
+futures = lazy_import("concurrent.futures")
+
+class Catalog:
+    '''
+    The resources and creatables that a game is played with, and a planner for them.  Nothing changes a catalog
+    once it has been loaded so any number of games can share the same one.  Anything that would otherwise be
+    worked out the first time it was used is worked out when the catalog is loaded, and only one game gets to
+    load it.
+    '''
+
+    CACHE_FILE = "catalog.cache"
+
+    def __init__(self, data_dir: str):
+
+        self.data_dir = data_dir
+        self.resources = ResourceFactory(data_dir + "resources.csv")
+        self.creatables = CreatableFactoryXML(data_dir + "creatables.xml", self.resources)
+        self.planner = None
+
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_loaded(self):
+        return self._loaded
+
+    # Load the catalog unless it has already been loaded
+    def load(self, verbose : bool = False):
+
+        with self._lock:
+            if self._loaded is False:
+                self._load(verbose)
+                self._loaded = True
+
+    def _load(self, verbose : bool):
+
+        # Use the compiled catalog if the source files haven't changed since it was made
+        catalog_cache = CatalogCache(self.data_dir + Catalog.CACHE_FILE,
+                                     [self.resources.file_name, self.creatables.file_name])
+
+        if catalog_cache.load(self.resources, self.creatables) is False:
+            self.resources.load(verbose=verbose)
+            self.creatables.load(verbose=verbose)
+            try:
+                catalog_cache.save(self.resources, self.creatables)
+            except OSError as err:
+                logging.warning("Unable to save catalog cache %s: %s", catalog_cache.file_name, err)
+
+        # Compile the pre-requisites of every creatable, and plan how to make one of each
+        for name in self.creatables.names:
+            self.creatables.get_creatable(name).get_requirements(self.resources)
+        self.creatables.get_requirements_matrix()
+
+        self.planner = ProductionPlanner(self.creatables)
+        for name in self.planner.order:
+            self.planner.plan(name)
+
 
 class Game:
 
@@ -19,20 +89,39 @@ class Game:
     # Events
     EVENT_TICK = "tick"
     EVENT_STATE = "state"
+    EVENT_MAP = "map"
 
     GAME_DATA_DIR = os.path.dirname(__file__) + "\\data\\"
 
-    def __init__(self, name : str):
+    def __init__(self, name : str, chunked_world : bool = False, world_file : str = None, seed : int = None,
+                 verbose : bool = False, catalog : Catalog = None):
 
         self.name = name
-        self.events = EventQueue()
+        self.verbose = verbose
+
+        # The catalog can be shared with other games.  If there isn't one then the game loads its own.
+        self.catalog = catalog
+
+        # Everything random in the game comes from the seed so that a game can be played again exactly
+        if seed is None:
+            seed = random.SystemRandom().getrandbits(32)
+
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.chunked_world = chunked_world
+        self.world_file = world_file
+        self.events = EventBus(coalesce=[Game.EVENT_TICK])
         self._state = Game.STATE_LOADED
         self._tick_count = 0
+        self.saver = GameSaver(self)
         self.inventory = None
         self.resources = None
         self.creatables = None
+        self.planner = None
         self.creations = None
-        self.map = None
+        self.scheduler = None
+        self._map = None
+        self._map_future = None
 
 
     @property
@@ -45,50 +134,150 @@ class Game:
         self._state = new_state
 
         self.events.add_event(Event(self._state,
-                                    "Game state change from {0} to {1}".format(self._old_state, self._state),
-                                    Game.EVENT_STATE))
+                                    "Game state change from {0} to {1}",
+                                    Game.EVENT_STATE,
+                                    (self._old_state, self._state)))
 
     def __str__(self):
         return self.name
 
+    @property
+    def tick_count(self):
+        return self._tick_count
+
+    @tick_count.setter
+    def tick_count(self, new_tick_count : int):
+        self._tick_count = new_tick_count
+
     def start(self):
 
         self.state = Game.STATE_PLAYING
+        self.rng = random.Random(self.seed)
+
+        self.load_catalog()
+        self.inventory = Inventory(self.resources)
+
+        # Make the map in the background so that everything that doesn't need it can carry on straight away
+        self._map = None
+        map_executor = futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="map")
+        self._map_future = map_executor.submit(self.create_map)
+        map_executor.shutdown(wait=False)
 
-        self.inventory = Inventory()
-        self.resources = ResourceFactory(Game.GAME_DATA_DIR + "resources.csv")
-        self.resources.load()
+        self.creations = CreationTable(self.creatables)
+        self.scheduler = TickScheduler(self.creations)
 
-        self.creatables = CreatableFactoryXML(Game.GAME_DATA_DIR + "creatables.xml")
-        self.creatables.load()
+    def load_catalog(self):
 
-        self.map = WorldMap("Kingdom 2", 50, 50)
-        self.map.initialise()
+        if self.catalog is None:
+            self.catalog = Catalog(Game.GAME_DATA_DIR)
 
-        self.creations = []
+        self.catalog.load(verbose=self.verbose)
+
+        self.resources = self.catalog.resources
+        self.creatables = self.catalog.creatables
+        self.planner = self.catalog.planner
+
+    # Save the whole game to the specified file, or if no file is specified just what has changed since the last save
+    def save(self, file_name : str = None):
+        if file_name is None:
+            self.saver.save_delta()
+        else:
+            self.saver.save(file_name)
+
+    # Load a saved game along with any changes saved after it
+    def load(self, file_name : str):
+
+        self.load_catalog()
+        self.saver.load(file_name)
+
+        if self.state != Game.STATE_PLAYING:
+            self.state = Game.STATE_PLAYING
+
+    # The map, waiting for it to finish being made if need be
+    @property
+    def map(self):
+        if self._map is None and self._map_future is not None:
+            self._map = self._map_future.result()
+        return self._map
+
+    @map.setter
+    def map(self, new_map : WorldMap):
+        self._map = new_map
+        self._map_future = None
+
+    @property
+    def is_map_ready(self):
+        return self._map is not None or (self._map_future is not None and self._map_future.done())
+
+    # Wait for up to timeout seconds for the map to be made.  Returns False if it is still being made.
+    def wait_for_map(self, timeout : float = None):
+        if self._map_future is None:
+            return True
+        futures.wait([self._map_future], timeout=timeout)
+        return self._map_future.done()
+
+    # Make the map, reporting progress as events.  This runs on a worker thread.
+    def create_map(self):
+
+        def progress(message):
+            self.events.add_event(Event(Game.EVENT_MAP, message, Game.EVENT_MAP))
+
+        progress("Making the map...")
+
+        try:
+            if self.chunked_world is True:
+                new_map = ChunkedWorldMap("Kingdom 2", 50, 50, seed=self.seed, resource_factory=self.resources)
+                new_map.progress = progress
+                new_map.initialise()
+            elif self.world_file is not None:
+                new_map = WorldMap("Kingdom 2", resource_factory=self.resources)
+                new_map.progress = progress
+                # Copy on write so that the game can change the map without changing the world file
+                new_map.load(self.world_file, mode="c")
+            else:
+                new_map = WorldMap("Kingdom 2", 50, 50, seed=self.seed, resource_factory=self.resources)
+                new_map.progress = progress
+                new_map.initialise()
+        except Exception as err:
+            progress("Unable to make the map: {0}".format(err))
+            raise
+
+        new_map.progress = None
+        progress("Map ready")
+
+        return new_map
 
     def add_creation(self, new_creation : Creatable):
-        self.creations.append(new_creation)
+        row = self.creations.add(new_creation)
+        return self.creations[row]
+
+    # Move the game on by the specified number of ticks.  Rather than stepping through every tick the scheduler
+    # jumps from one completion to the next, so long runs cost in proportion to the number of completions.
+    def tick(self, ticks : int = 1):
 
-    def tick(self):
-        self._tick_count += 1
+        if isinstance(ticks, int) is False or ticks < 1:
+            raise Exception("Can't tick the game by {0}: ticks must be a whole number greater than 0".format(ticks))
 
+        if self.scheduler is None:
+            raise Exception("Can't tick the game before it has been started")
+
+        completed = self.scheduler.advance(ticks, self.inventory, self.creatables)
+
+        self._tick_count += ticks
+
+        # One event for however many ticks so that coalesced tick events count ticks rather than calls
         self.events.add_event(Event(Game.EVENT_TICK,
-                                    "Game ticked to {0}".format(self._tick_count),
-                                    Game.EVENT_TICK))
+                                    "Game ticked to {0}",
+                                    Game.EVENT_TICK,
+                                    (self._tick_count,),
+                                    count=ticks))
 
-        for creation in self.creations:
-            if self.inventory.is_creatable(creation):
-                creation.tick()
+        for row in completed:
+            self.creations[row].do_complete()
 
     def do_game_over(self):
 
         self.state = Game.STATE_GAME_OVER
 
     def get_next_event(self):
-
-        next_event = None
-        if self.events.size() > 0:
-            next_event = self.events.pop_event()
-
-        return next_event
\ No newline at end of file
+        return self.events.pop_event()
\ No newline at end of file
@@ -0,0 +1,251 @@
+import collections
+import logging
+import threading
+import types
+
+from .building_blocks import CreatableFactoryXML
+from .building_blocks import Inventory
+
+
+class ProductionPlan:
+    '''
+    What it takes to make a number of a creatable: the raw resources, how many of each creatable need making
+    along the way, the total ticks of work and how long it takes if everything that can be made in parallel is.
+    '''
+
+    def __init__(self, name: str, count: int, raw: dict, creations: dict, ticks: int, duration: int):
+        self.name = name
+        self.count = count
+        self.raw = types.MappingProxyType(raw)
+        self.creations = types.MappingProxyType(creations)
+        self.ticks = ticks
+        self.duration = duration
+
+    def __str__(self):
+
+        _str = "Plan for {0} x {1}: {2} ticks of work taking {3} ticks".format(self.count, self.name,
+                                                                              self.ticks, self.duration)
+
+        if len(self.raw) > 0:
+            _str += "\n\tRaw resources:"
+            for k, v in self.raw.items():
+                _str += "\n\t\t- {0}:{1}".format(k, v)
+
+        if len(self.creations) > 0:
+            _str += "\n\tCreations:"
+            for k, v in self.creations.items():
+                _str += "\n\t\t- {0}:{1}".format(k, v)
+
+        return _str
+
+
+class ProductionPlanner:
+    '''
+    Works out production chains over a catalog of creatables.  A pre-requisite that is the output of another
+    creatable is made from that creatable rather than treated as a raw resource, so the catalog forms a graph
+    of which creatables feed which.  The graph is built once and plans are remembered until the catalog changes.
+    '''
+
+    # Most plans to remember before starting again
+    MAX_PLANS = 100000
+
+    def __init__(self, creatables: CreatableFactoryXML):
+
+        self.creatables = creatables
+
+        # For each resource the creatable that makes it and how many one creation makes
+        self._producers = {}
+
+        # (creatable, resource) pre-requisites that would make a loop so are treated as raw
+        self._cut = set()
+
+        # The creatables ordered so that each comes after everything that feeds it
+        self.order = []
+
+        self._plans = {}
+        self._catalog_version = None
+
+        # The planner can be shared by games on different threads
+        self._lock = threading.Lock()
+
+        self.refresh()
+
+    # Rebuild the graph if the catalog has been loaded again since we last looked
+    def refresh(self):
+
+        with self._lock:
+            if self._catalog_version != self.creatables.version:
+                self._refresh()
+
+    def _refresh(self):
+
+        self._catalog_version = self.creatables.version
+        self._plans = {}
+        self._producers = {}
+        self._cut = set()
+        self.order = []
+
+        # Creatables make their outputs, and a resource named after a creatable is made one at a time by it
+        for name in self.creatables.names:
+            for resource, count in self.creatables.get_creatable(name).output.items():
+                if resource not in self._producers and count > 0:
+                    self._producers[resource] = (name, count)
+
+        for name in self.creatables.names:
+            if name not in self._producers:
+                self._producers[name] = (name, 1)
+
+        # Depth first search to put the creatables in order and find any loops
+        visiting = set()
+        visited = set()
+
+        def visit(name):
+            visiting.add(name)
+            for resource in self.creatables.get_creatable(name).pre_requisites.keys():
+                producer = self._producers.get(resource)
+                if producer is None or producer[0] in visited:
+                    continue
+                if producer[0] in visiting:
+                    logging.warning("{0}.refresh(): {1} needs {2} which needs {1} so treating {2} as raw".format(
+                        __class__, name, resource))
+                    self._cut.add((name, resource))
+                    continue
+                visit(producer[0])
+            visiting.remove(name)
+            visited.add(name)
+            self.order.append(name)
+
+        for name in self.creatables.names:
+            if name not in visited:
+                visit(name)
+
+    # Work out what it takes to make the specified number of the specified creatable
+    def plan(self, name: str, count: int = 1):
+
+        if isinstance(count, int) is False or count < 1:
+            raise Exception("Can't plan to make {0} x {1}: the count must be a whole number greater than 0".format(
+                count, name))
+
+        self.refresh()
+
+        key = (name, count)
+        plan = self._plans.get(key)
+        if plan is not None:
+            return plan
+
+        creatable = self.creatables.get_creatable(name)
+
+        raw = collections.Counter()
+        creations = collections.Counter({name: count})
+        ticks = creatable.ticks_required * count
+        duration = 0
+
+        for resource, resource_count in creatable.pre_requisites.items():
+
+            needed = resource_count * count
+            producer = self._producers.get(resource)
+
+            if producer is None or (name, resource) in self._cut:
+                raw[resource] += needed
+                continue
+
+            # Nothing needs making for a need of 0
+            if needed <= 0:
+                continue
+
+            producer_name, produced = producer
+            sub_plan = self.plan(producer_name, -(-needed // produced))
+            raw.update(sub_plan.raw)
+            creations.update(sub_plan.creations)
+            ticks += sub_plan.ticks
+            duration = max(duration, sub_plan.duration)
+
+        plan = ProductionPlan(name, count, dict(raw), dict(creations), ticks, duration + creatable.ticks_required)
+
+        with self._lock:
+            if len(self._plans) >= ProductionPlanner.MAX_PLANS:
+                self._plans = {}
+            self._plans[key] = plan
+
+        return plan
+
+    # Work out the most of the specified creatable that can be made from what is in the inventory, using up any
+    # stock of the resources that it needs along the way before making more of them from their own resources.
+    # Returns None if it doesn't need any raw resources so there is no limit.
+    def max_buildable(self, name: str, inventory: Inventory):
+
+        self.refresh()
+
+        def get_count(resource_name):
+            resource = self.creatables.resource_factory.get_resource(resource_name)
+            if resource is None:
+                return 0
+            return inventory.get_count(resource)
+
+        # For each creatable the resources that it is the producer of
+        products = collections.defaultdict(list)
+        for resource_name, (producer_name, produced) in self._producers.items():
+            products[producer_name].append((resource_name, produced))
+
+        def is_buildable(count):
+
+            # Resources that can be taken from the inventory or made, and those that can only be taken
+            needed = collections.Counter()
+            raw = collections.Counter()
+            used = collections.Counter()
+            made = collections.Counter({name: count})
+
+            # Everything that uses a creatable's outputs comes before it in reverse order so by the time we get
+            # to a creatable we know how many of its outputs are needed
+            for creatable_name in reversed(self.order):
+
+                for resource_name, produced in products[creatable_name]:
+                    used[resource_name] = min(needed[resource_name], get_count(resource_name))
+                    shortfall = needed[resource_name] - used[resource_name]
+                    made[creatable_name] += -(-shortfall // produced)
+
+                if made[creatable_name] == 0:
+                    continue
+
+                pre_requisites = self.creatables.get_creatable(creatable_name).pre_requisites
+                for resource_name, resource_count in pre_requisites.items():
+                    if resource_count <= 0:
+                        continue
+                    if resource_name in self._producers and (creatable_name, resource_name) not in self._cut:
+                        needed[resource_name] += resource_count * made[creatable_name]
+                    else:
+                        raw[resource_name] += resource_count * made[creatable_name]
+
+            for resource_name, raw_count in raw.items():
+                if get_count(resource_name) < raw_count + used[resource_name]:
+                    return False
+
+            return True
+
+        # Needs of 0 don't limit anything
+        needs = {resource_name: needed for resource_name, needed in self.plan(name, 1).raw.items() if needed > 0}
+        if len(needs) == 0:
+            return None
+
+        # Making more at once never needs more than making them one at a time, as production rounds up to
+        # whole creations, and stock only saves making things, so this many can definitely be made...
+        low = min(get_count(resource_name) // needed for resource_name, needed in needs.items())
+        if low == 0 and is_buildable(1) is False:
+            return 0
+        low = max(low, 1)
+
+        # ...and every need grows with the count so doubling always finds a count that can't be made.
+        # Then search between the last two counts.
+        high = low * 2
+        while is_buildable(high) is True:
+            low = high
+            high *= 2
+
+        while high - low > 1:
+            middle = (low + high) // 2
+            if is_buildable(middle) is True:
+                low = middle
+            else:
+                high = middle
+
+        return low
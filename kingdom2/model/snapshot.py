@@ -0,0 +1,426 @@
+import json
+import os
+import uuid
+
+from .building_blocks import Creatable
+from .building_blocks import CreationTable
+from .building_blocks import Inventory
+from .building_blocks import TickScheduler
+from .building_blocks import TilePalette
+from .building_blocks import WorldMap
+from .building_blocks import ChunkedWorldMap
+from .utils import lazy_import
+
+numpy = lazy_import("numpy")
+
+
+class GameSaver:
+    '''
+    Saves a game as a snapshot of its map, inventory and creations followed by any number of deltas that only hold
+    what has changed since the last save.  The arrays are stored raw in .npz files and the catalog is referred to
+    by the names of its resources and creatables so nothing gets pickled.
+
+    The snapshot goes in the named file and each delta after it in the same file with .1, .2, ... on the end.
+    A delta only has the names of resources, creatables and map tiles that are new since the last save and leaves
+    out anything that hasn't changed, so its size depends on how much has changed rather than on the size of the game.
+    The state of the game's random number generator is saved as an array in the snapshot and only saved again in a
+    delta if something has used it since the last save.
+    '''
+
+    FILE_VERSION = 3
+
+    KIND_SNAPSHOT = "snapshot"
+    KIND_DELTA = "delta"
+
+    def __init__(self, game):
+
+        self.game = game
+        self.file_name = None
+
+        # Which snapshot the deltas belong to and how many deltas there have been
+        self.snapshot_id = None
+        self.sequence = 0
+
+        # What the game looked like at the last save
+        self._tracker = None
+        self._tracked_map = None
+        self._inventory = None
+        self._creations = None
+
+        # How many resource, creatable and tile names had been saved at the last save
+        self._name_counts = None
+        self._rng_state = None
+
+    @property
+    def has_snapshot(self):
+        return self.snapshot_id is not None
+
+    @staticmethod
+    def delta_file_name(file_name: str, sequence: int):
+        return "{0}.{1}".format(file_name, sequence)
+
+    # Save a full snapshot of the game, throwing away any deltas from an earlier snapshot with the same name
+    def save(self, file_name: str):
+
+        game = self.game
+        world = GameSaver.get_saveable_map(game)
+
+        self.file_name = file_name
+        self.snapshot_id = uuid.uuid4().hex
+        self.sequence = 0
+
+        meta = self.get_meta(GameSaver.KIND_SNAPSHOT)
+        meta["map"] = {"name": world.name, "seed": world.seed, "width": world.width, "height": world.height,
+                       "rng": world.rng.bit_generator.state}
+
+        creations = game.creations
+        rows = numpy.arange(len(creations))
+        meta["custom"] = GameSaver.get_custom_recipes(creations, rows)
+
+        GameSaver.write(file_name, meta,
+                        resource_names=self.get_resource_names(),
+                        creatable_names=numpy.array(game.creatables.names, dtype=str),
+                        inventory=game.inventory.counts,
+                        creation_type_ids=creations.type_ids[:len(creations)],
+                        creation_ticks_done=creations.get_all_ticks_done(),
+                        creation_ticks_required=creations.ticks_required[:len(creations)],
+                        creation_status=creations.status[:len(creations)],
+                        palette=numpy.array(world.palette.names, dtype=str),
+                        tiles=world.tiles,
+                        topo=world.topo_model_pass2,
+                        rng=self.get_rng_state(meta))
+
+        sequence = 1
+        while os.path.exists(GameSaver.delta_file_name(file_name, sequence)) is True:
+            os.remove(GameSaver.delta_file_name(file_name, sequence))
+            sequence += 1
+
+        self.checkpoint()
+
+    # Save just what has changed since the last save
+    def save_delta(self):
+
+        if self.has_snapshot is False:
+            raise Exception("A full save is needed before changes can be saved!")
+
+        game = self.game
+        world = GameSaver.get_saveable_map(game)
+
+        if world is not self._tracked_map:
+            raise Exception("The map has changed since the last full save!")
+
+        self.sequence += 1
+        meta = {"version": GameSaver.FILE_VERSION,
+                "kind": GameSaver.KIND_DELTA,
+                "snapshot": self.snapshot_id,
+                "sequence": self.sequence,
+                "tick": game.tick_count}
+
+        # Inventory counts that have changed...
+        counts = game.inventory.counts
+        old_counts = numpy.zeros(len(counts), dtype=numpy.int64)
+        old_counts[:len(self._inventory)] = self._inventory
+        inventory_ids = numpy.flatnonzero(counts != old_counts)
+
+        # ...creations that have been added or have made progress...
+        creations = game.creations
+        ticks_done = creations.get_all_ticks_done()
+        status = creations.status[:len(creations)]
+        old_size, old_type_ids, old_ticks_done, old_status = self._creations
+        changed = (old_type_ids != creations.type_ids[:old_size]) | (old_ticks_done != ticks_done[:old_size]) | \
+                  (old_status != status[:old_size])
+        rows = numpy.concatenate((numpy.flatnonzero(changed), numpy.arange(old_size, len(creations))))
+        custom = GameSaver.get_custom_recipes(creations, rows)
+        if len(custom) > 0:
+            meta["custom"] = custom
+
+        # ...and the map squares that have changed, one at a time or as areas
+        squares = numpy.array(sorted(self._tracker.squares), dtype=numpy.int64).reshape(-1, 2)
+        areas = numpy.array(self._tracker.areas, dtype=numpy.int64).reshape(-1, 4)
+        area_tiles = [world.tiles[x:x + width, y:y + height].ravel() for x, y, width, height in areas.tolist()]
+
+        # Only the names that have been added since the last save
+        resource_count, creatable_count, palette_count = self._name_counts
+
+        arrays = {"resource_names": self.get_resource_names()[resource_count:],
+                  "creatable_names": numpy.array(game.creatables.names[creatable_count:], dtype=str),
+                  "palette": numpy.array(world.palette.names[palette_count:], dtype=str),
+                  "inventory_ids": inventory_ids,
+                  "inventory_counts": counts[inventory_ids],
+                  "creation_rows": rows,
+                  "creation_type_ids": creations.type_ids[rows],
+                  "creation_ticks_done": ticks_done[rows],
+                  "creation_ticks_required": creations.ticks_required[rows],
+                  "creation_status": status[rows],
+                  "squares": squares,
+                  "square_tiles": world.tiles[squares[:, 0], squares[:, 1]],
+                  "areas": areas,
+                  "area_tiles": numpy.concatenate(area_tiles) if len(area_tiles) > 0 else numpy.zeros(0, numpy.uint8)}
+
+        if game.rng.getstate() != self._rng_state:
+            arrays["rng"] = self.get_rng_state(meta)
+
+        # Leave out anything that is empty
+        GameSaver.write(GameSaver.delta_file_name(self.file_name, self.sequence), meta,
+                        **{name: array for name, array in arrays.items() if len(array) > 0})
+
+        self.checkpoint()
+
+    # Load a snapshot and then any deltas that follow it
+    def load(self, file_name: str):
+
+        game = self.game
+
+        with numpy.load(file_name, allow_pickle=False) as data:
+
+            meta = GameSaver.read_meta(data, GameSaver.KIND_SNAPSHOT, file_name)
+
+            map_meta = meta["map"]
+            world = WorldMap(map_meta["name"], map_meta["width"], map_meta["height"], seed=map_meta["seed"],
+                             resource_factory=game.resources)
+            world.rng.bit_generator.state = map_meta["rng"]
+            world.topo_model_pass2 = data["topo"]
+            world.palette = TilePalette()
+            world.tiles = numpy.zeros((world.width, world.height), dtype=numpy.uint8)
+
+            inventory = Inventory(game.resources)
+            creations = CreationTable(game.creatables)
+            creations.tick_count = meta["tick"]
+
+            # The names that the saved ids refer to
+            resource_names = data["resource_names"].tolist()
+            creatable_names = data["creatable_names"].tolist()
+            palette = data["palette"].tolist()
+
+            rows = numpy.arange(len(data["creation_type_ids"]))
+            self.apply(data, meta, inventory, creations, resource_names, creatable_names,
+                       numpy.arange(len(data["inventory"])), data["inventory"], rows)
+
+            tile_lookup = self.get_palette_lookup(palette, world)
+            world.tiles[:, :] = tile_lookup[data["tiles"]]
+
+            rng_meta = meta["rng"]
+            rng_state = data["rng"]
+
+        self.file_name = file_name
+        self.snapshot_id = meta["snapshot"]
+        self.sequence = 0
+        snapshot_meta = meta
+
+        # Apply each of the deltas in turn
+        while os.path.exists(GameSaver.delta_file_name(file_name, self.sequence + 1)) is True:
+
+            delta_file_name = GameSaver.delta_file_name(file_name, self.sequence + 1)
+
+            with numpy.load(delta_file_name, allow_pickle=False) as data:
+
+                meta = GameSaver.read_meta(data, GameSaver.KIND_DELTA, delta_file_name)
+                if meta["snapshot"] != self.snapshot_id or meta["sequence"] != self.sequence + 1:
+                    raise Exception("{0} doesn't follow on from {1}!".format(delta_file_name, file_name))
+
+                resource_names += GameSaver.get_array(data, "resource_names", "str").tolist()
+                creatable_names += GameSaver.get_array(data, "creatable_names", "str").tolist()
+                palette += GameSaver.get_array(data, "palette", "str").tolist()
+
+                creations.tick_count = meta["tick"]
+                self.apply(data, meta, inventory, creations, resource_names, creatable_names,
+                           GameSaver.get_array(data, "inventory_ids"), GameSaver.get_array(data, "inventory_counts"),
+                           GameSaver.get_array(data, "creation_rows"))
+
+                tile_lookup = self.get_palette_lookup(palette, world)
+                squares = GameSaver.get_array(data, "squares").reshape(-1, 2)
+                world.tiles[squares[:, 0], squares[:, 1]] = tile_lookup[GameSaver.get_array(data, "square_tiles",
+                                                                                            "uint8")]
+
+                area_tiles = tile_lookup[GameSaver.get_array(data, "area_tiles", "uint8")]
+                start = 0
+                for x, y, width, height in GameSaver.get_array(data, "areas").reshape(-1, 4).tolist():
+                    end = start + width * height
+                    world.tiles[x:x + width, y:y + height] = area_tiles[start:end].reshape(width, height)
+                    start = end
+
+                if "rng" in data.files:
+                    rng_meta = meta["rng"]
+                    rng_state = data["rng"]
+
+            self.sequence += 1
+
+        world.build_pyramid()
+
+        game.map = world
+        game.inventory = inventory
+        game.creations = creations
+        game.scheduler = TickScheduler(creations)
+        game.tick_count = meta["tick"]
+        game.seed = snapshot_meta["seed"]
+        game.rng.setstate((rng_meta["version"], tuple(rng_state.tolist()), rng_meta["gauss"]))
+
+        self.checkpoint()
+
+    # Apply the inventory counts and creation rows from a snapshot or delta.  The ids in the file refer to the
+    # specified lists of resource and creatable names.
+    def apply(self, data, meta: dict, inventory: Inventory, creations: CreationTable, resource_names: list,
+              creatable_names: list, inventory_ids, inventory_counts, creation_rows):
+
+        game = self.game
+
+        resource_lookup = GameSaver.get_lookup(resource_names, game.resources.get_resource_id, "resource")
+        ids = resource_lookup[inventory_ids]
+        inventory.resize(int(ids.max()) + 1 if len(ids) > 0 else 0)
+        inventory.counts[ids] = inventory_counts
+        inventory.version += 1
+
+        creatable_lookup = GameSaver.get_lookup(creatable_names, game.creatables.get_creatable_id, "creatable")
+        type_ids = GameSaver.get_array(data, "creation_type_ids")
+        type_ids = numpy.where(type_ids < 0, -1, creatable_lookup[numpy.maximum(type_ids, 0)])
+
+        custom = {}
+        for row, recipe in meta.get("custom", {}).items():
+            creatable = Creatable(recipe["name"], recipe["description"], recipe["ticks_required"])
+            for name, count in recipe["pre_requisites"].items():
+                creatable.add_pre_requisite(name, count)
+            for name, count in recipe["output"].items():
+                creatable.add_output(name, count)
+            custom[int(row)] = creatable
+
+        creations.set_rows(creation_rows, type_ids, GameSaver.get_array(data, "creation_ticks_done"),
+                           GameSaver.get_array(data, "creation_ticks_required"),
+                           GameSaver.get_array(data, "creation_status", "int8"), custom)
+
+    # Get an array that maps the tile values in a saved file onto the map's palette
+    def get_palette_lookup(self, palette: list, world: WorldMap):
+
+        lookup = numpy.zeros(TilePalette.MAX_SIZE, dtype=numpy.uint8)
+
+        for index, name in enumerate(palette):
+            resource = self.game.resources.get_resource(name)
+            if resource is None:
+                raise Exception("Saved game uses unknown resource {0}!".format(name))
+            lookup[index + 1] = world.palette.index(resource)
+
+        return lookup
+
+    # Get an array that maps saved ids onto ids in the current catalog
+    @staticmethod
+    def get_lookup(saved_names: list, get_id, what: str):
+
+        lookup = numpy.zeros(len(saved_names), dtype=numpy.int64)
+
+        for index, name in enumerate(saved_names):
+            lookup[index] = get_id(name)
+            if lookup[index] < 0:
+                raise Exception("Saved game uses unknown {0} {1}!".format(what, name))
+
+        return lookup
+
+    # Remember what the game looks like now so the next delta only has what changes after this
+    def checkpoint(self):
+
+        game = self.game
+        world = game.map
+
+        if self._tracker is not None:
+            self._tracked_map.stop_tracking(self._tracker)
+
+        self._tracker = world.track_changes()
+        self._tracked_map = world
+        self._inventory = game.inventory.counts.copy()
+
+        creations = game.creations
+        self._creations = (len(creations),
+                           creations.type_ids[:len(creations)].copy(),
+                           creations.get_all_ticks_done(),
+                           creations.status[:len(creations)].copy())
+
+        self._name_counts = (game.resources.get_resource_count(), game.creatables.count, len(world.palette.names))
+        self._rng_state = game.rng.getstate()
+
+    # Forget the last save so that changes can't be saved until there has been a full save
+    def reset(self):
+
+        if self._tracker is not None:
+            self._tracked_map.stop_tracking(self._tracker)
+
+        self.file_name = None
+        self.snapshot_id = None
+        self.sequence = 0
+        self._tracker = None
+        self._tracked_map = None
+        self._inventory = None
+        self._creations = None
+        self._name_counts = None
+        self._rng_state = None
+
+    def get_meta(self, kind: str):
+        return {"version": GameSaver.FILE_VERSION,
+                "kind": kind,
+                "snapshot": self.snapshot_id,
+                "sequence": self.sequence,
+                "name": self.game.name,
+                "tick": self.game.tick_count,
+                "seed": self.game.seed}
+
+    # Get the state of the game's random number generator as an array, adding the rest of it to the meta
+    def get_rng_state(self, meta: dict):
+        version, state, gauss = self.game.rng.getstate()
+        meta["rng"] = {"version": version, "gauss": gauss}
+        return numpy.array(state, dtype=numpy.uint32)
+
+    def get_resource_names(self):
+        return numpy.array([resource.name for resource in self.game.resources.resource_list], dtype=str)
+
+    @staticmethod
+    def get_saveable_map(game):
+
+        world = game.map
+        if world is None:
+            raise Exception("There is no game to save!")
+        if isinstance(world, ChunkedWorldMap) is True:
+            raise Exception("Chunked worlds can't be saved!")
+
+        return world
+
+    # Get the recipes of any of the specified rows that don't come from the catalog
+    @staticmethod
+    def get_custom_recipes(creations: CreationTable, rows):
+
+        custom = {}
+
+        for row in rows[creations.type_ids[rows] < 0].tolist():
+            creatable = creations.get_prototype(row)
+            custom[str(row)] = {"name": creatable.name,
+                                "description": creatable.description,
+                                "ticks_required": creatable.ticks_required,
+                                "pre_requisites": dict(creatable.pre_requisites),
+                                "output": dict(creatable.output)}
+
+        return custom
+
+    # Get an array from a saved file, or an empty one if it was left out because it was empty
+    @staticmethod
+    def get_array(data, name: str, dtype: str = "int64"):
+        if name in data.files:
+            return data[name]
+        return numpy.zeros(0, dtype=dtype)
+
+    @staticmethod
+    def read_meta(data, kind: str, file_name: str):
+
+        meta = json.loads(data["meta"].tobytes().decode("utf-8"))
+
+        if meta.get("version") != GameSaver.FILE_VERSION or meta.get("kind") != kind:
+            raise Exception("{0} is not a saved game {1}!".format(file_name, kind))
+
+        return meta
+
+    # Write the arrays to a file, writing to a temporary file first so that nobody ever sees half a save
+    @staticmethod
+    def write(file_name: str, meta: dict, **arrays):
+
+        temp_file_name = file_name + ".tmp"
+
+        with open(temp_file_name, "wb") as save_file:
+            meta = numpy.frombuffer(json.dumps(meta).encode("utf-8"), dtype=numpy.uint8)
+            numpy.savez(save_file, meta=meta, **arrays)
+
+        os.replace(temp_file_name, file_name)
@@ -0,0 +1,340 @@
+import functools
+
+from .utils import lazy_import
+
+numpy = lazy_import("numpy")
+
+# Topo controls
+MAX_ALTITUDE = 10.0
+MIN_ALTITUDE_CLIP_FACTOR = -0.5
+ALTITUDE_OFFSET = 0.0
+MIN_ALTITUDE = 0.0
+MAX_SLOPE = MAX_ALTITUDE * 0.15
+MIN_SLOPE = MAX_SLOPE * -1.0
+MAX_SLOPE_DELTA = MAX_SLOPE * 2.0
+
+# Seed streams used to derive independent generators for each part of a chunked world
+STREAM_CHUNK = 0
+STREAM_OBJECTS = 4
+
+# How many recently generated chunk surfaces to keep for joining onto their neighbours
+SURFACE_CACHE_SIZE = 64
+
+# How far into a chunk (as a fraction of its size) the seams get blended
+SEAM_BLEND_FRACTION = 0.25
+
+
+def generate_altitudes(width: int, height: int, rng=None):
+    '''
+    Pass 1: build an initial topography from altitudes and random slope changes.
+
+    Each point takes the average of its north and west neighbours plus their slopes, and the slopes
+    random walk east along each row and south along each column.  The arrays are padded with an extra
+    row and column holding the random boundary values so that the recurrence needs no edge checks.
+    Returns a (width, height) array indexed [x, y].
+    '''
+
+    if rng is None:
+        rng = numpy.random
+
+    padded_height = height + 1
+
+    # Slopes are independent random walks so each step can be done for a whole row/column at once
+    east_slopes = numpy.empty((width + 1, padded_height))
+    east_slopes[0, 1:] = rng.uniform(MIN_SLOPE, MAX_SLOPE, height)
+    for x in range(1, width + 1):
+        step = east_slopes[x, 1:]
+        numpy.add(east_slopes[x - 1, 1:], rng.uniform(-MAX_SLOPE_DELTA / 2, MAX_SLOPE_DELTA / 2, height), out=step)
+        numpy.clip(step, MIN_SLOPE, MAX_SLOPE, out=step)
+
+    south_slopes = numpy.empty((width + 1, padded_height))
+    south_slopes[1:, 0] = rng.uniform(MIN_SLOPE, MAX_SLOPE, width)
+    for y in range(1, padded_height):
+        step = south_slopes[1:, y]
+        numpy.add(south_slopes[1:, y - 1], rng.uniform(-MAX_SLOPE_DELTA / 2, MAX_SLOPE_DELTA / 2, width), out=step)
+        numpy.clip(step, MIN_SLOPE, MAX_SLOPE, out=step)
+
+    altitudes = numpy.empty((width + 1, padded_height))
+    altitudes[1:, 0] = rng.uniform(MIN_ALTITUDE, MAX_ALTITUDE, width)
+    altitudes[0, 1:] = rng.uniform(MIN_ALTITUDE, MAX_ALTITUDE, height)
+
+    # Each altitude depends on its north and west neighbours so sweep the map one anti-diagonal at a time.
+    # In the flattened array the points on a diagonal are evenly spaced which makes every diagonal a plain slice.
+    flat_altitudes = altitudes.reshape(-1)
+    flat_east_slopes = east_slopes.reshape(-1)
+    flat_south_slopes = south_slopes.reshape(-1)
+
+    for d in range(2, width + height + 1):
+        x0 = max(1, d - height)
+        x1 = min(width, d - 1)
+        start = d + x0 * height
+        stop = d + x1 * height + 1
+
+        diagonal = slice(start, stop, height)
+        north = slice(start - 1, stop - 1, height)
+        west = slice(start - padded_height, stop - padded_height, height)
+
+        step = flat_altitudes[diagonal]
+        numpy.add(flat_altitudes[north], flat_south_slopes[north], out=step)
+        step += flat_altitudes[west]
+        step += flat_east_slopes[west]
+        step *= 0.5
+        numpy.clip(step, MIN_ALTITUDE, MAX_ALTITUDE, out=step)
+
+    return altitudes[1:, 1:].copy()
+
+
+def smooth(a):
+    '''
+    Pass 2: replace each point with the average of itself and its neighbouring points.
+
+    The 3x3 box sum is separable so it is done as two shifted sums, one along each axis, and then
+    divided by how many neighbours each point really has so that the edges are not pulled down.
+    '''
+
+    width, height = a.shape
+
+    total = a.copy()
+    total[1:] += a[:-1]
+    total[:-1] += a[1:]
+
+    row_total = total.copy()
+    total[:, 1:] += row_total[:, :-1]
+    total[:, :-1] += row_total[:, 1:]
+
+    x_points = numpy.full(width, 3.0)
+    x_points[0] -= 1
+    x_points[-1] -= 1
+    y_points = numpy.full(height, 3.0)
+    y_points[0] -= 1
+    y_points[-1] -= 1
+
+    total /= numpy.outer(x_points, y_points)
+
+    return total
+
+
+def floor_threshold(a):
+    return numpy.mean(a) - (numpy.std(a) * MIN_ALTITUDE_CLIP_FACTOR)
+
+
+def apply_floor(a, threshold: float = None):
+    '''
+    Pass 3: clip the altitudes in place to create floors in the topology.
+    If no threshold is specified then it is worked out from the altitudes themselves.
+    Returns the altitude threshold that was used.
+    '''
+
+    if threshold is None:
+        threshold = floor_threshold(a)
+
+    numpy.maximum(a, threshold, out=a)
+
+    return threshold
+
+
+def new_seed():
+    '''Pick a new seed from fresh entropy without touching any global random state'''
+    return int(numpy.random.SeedSequence().generate_state(1)[0])
+
+
+def zigzag(n: int):
+    '''Map a signed integer onto a unique non-negative one so it can be used in a seed'''
+    return n * 2 if n >= 0 else (n * -2) - 1
+
+
+def seeded_rng(seed: int, stream: int, cx: int, cy: int):
+    '''
+    Get a random number generator for one part of a chunked world.
+    The same seed, stream and chunk coordinates always give the same sequence of numbers.
+    '''
+    sequence = numpy.random.SeedSequence(seed, spawn_key=(stream, zigzag(cx), zigzag(cy)))
+    return numpy.random.default_rng(sequence)
+
+
+@functools.lru_cache(maxsize=SURFACE_CACHE_SIZE)
+def generate_surface(seed: int, cx: int, cy: int, width: int, height: int):
+    '''
+    Generate passes 1 and 2 for chunk (cx, cy) on its own, before it gets joined to its neighbours.
+    Every chunk is needed by the 8 chunks around it so recent surfaces are cached and returned read only.
+    '''
+
+    altitudes = smooth(generate_altitudes(width, height, seeded_rng(seed, STREAM_CHUNK, cx, cy)))
+    altitudes.flags.writeable = False
+
+    return altitudes
+
+
+def corner_altitude(north_west, north_east, south_west, south_east):
+    '''The altitude at the point where 4 surfaces meet, which is the average of their corners'''
+    return (north_west[-1, -1] + north_east[0, -1] + south_west[-1, 0] + south_east[0, 0]) / 4
+
+
+def generate_seam(before, after, start: float, end: float):
+    '''
+    Generate the seam that runs between the last row of one surface and the first row of the next.
+
+    The seam follows the average of the two rows that face each other, bent to start and end on the corner
+    altitudes, so neither surface has far to move to meet it.  It also has a gradient across it taken from
+    the slopes of the two surfaces so that they can sit either side of it without leaving a flat ridge along
+    the join.  The gradient fades out at the ends so every seam still meets its corners exactly.
+    Returns a tuple of the seam altitudes and gradients.
+    '''
+
+    length = len(before[-1])
+
+    profile = (before[-1] + after[0]) / 2
+    profile += numpy.linspace(start - profile[0], end - profile[-1], length)
+    numpy.clip(profile, MIN_ALTITUDE, MAX_ALTITUDE, out=profile)
+
+    # A surface only one row deep has no slope of its own to give
+    gradient = numpy.zeros(length)
+    if len(before) > 1:
+        gradient += (before[-1] - before[-2]) / 2
+    if len(after) > 1:
+        gradient += (after[1] - after[0]) / 2
+    numpy.clip(gradient, MIN_SLOPE, MAX_SLOPE, out=gradient)
+    gradient *= numpy.sin(numpy.linspace(0.0, numpy.pi, length)) / 2
+
+    return profile, gradient
+
+
+def seam_weights(length: int, fraction: float = SEAM_BLEND_FRACTION):
+    '''How much of a seam is blended into each point moving away from it: 1.0 on the seam falling smoothly to 0.0'''
+
+    if length < 2:
+        return numpy.ones(length)
+
+    t = numpy.clip(1.0 - numpy.linspace(0.0, 1.0, length) / fraction, 0.0, 1.0)
+
+    return t * t * (3 - 2 * t)
+
+
+def blend_seams(a, west, east, north, south):
+    '''
+    Pull the edges of an area of altitudes onto the specified seam profiles.
+
+    The difference between each edge and its seam is spread back into the area using a Coons patch so
+    every edge ends up exactly on its seam while points away from the edges are left untouched.
+    The seams must agree at the corners where they meet.
+    '''
+
+    west_delta = west - a[0]
+    east_delta = east - a[-1]
+    north_delta = north - a[:, 0]
+    south_delta = south - a[:, -1]
+
+    west_weights = seam_weights(a.shape[0])
+    east_weights = west_weights[::-1]
+    north_weights = seam_weights(a.shape[1])
+    south_weights = north_weights[::-1]
+
+    correction = numpy.outer(west_weights, west_delta)
+    correction += numpy.outer(east_weights, east_delta)
+    correction += numpy.outer(north_delta, north_weights)
+    correction += numpy.outer(south_delta, south_weights)
+
+    # Take off the corners which have been counted twice
+    correction -= numpy.outer(west_weights, north_weights) * west_delta[0]
+    correction -= numpy.outer(west_weights, south_weights) * west_delta[-1]
+    correction -= numpy.outer(east_weights, north_weights) * east_delta[0]
+    correction -= numpy.outer(east_weights, south_weights) * east_delta[-1]
+
+    a += correction
+    numpy.clip(a, MIN_ALTITUDE, MAX_ALTITUDE, out=a)
+
+
+def join_surfaces(surfaces):
+    '''
+    Join the middle of a 3x3 grid of surfaces, indexed [x][y], onto the seams it shares with the surfaces around it.
+
+    The seams and corners only depend on the surfaces either side of them so neighbouring surfaces
+    always line up, however and whenever they get joined.  Surfaces that share a seam must share
+    the same width or height.  Returns the joined altitudes as a new array.
+    '''
+
+    (north_west, west, south_west), (north, altitudes, south), (north_east, east, south_east) = surfaces
+
+    north_west_corner = corner_altitude(north_west, north, west, altitudes)
+    north_east_corner = corner_altitude(north, north_east, altitudes, east)
+    south_west_corner = corner_altitude(west, altitudes, south_west, south)
+    south_east_corner = corner_altitude(altitudes, east, south, south_east)
+
+    west_seam, west_gradient = generate_seam(west, altitudes, north_west_corner, south_west_corner)
+    east_seam, east_gradient = generate_seam(altitudes, east, north_east_corner, south_east_corner)
+    north_seam, north_gradient = generate_seam(north.T, altitudes.T, north_west_corner, north_east_corner)
+    south_seam, south_gradient = generate_seam(altitudes.T, south.T, south_west_corner, south_east_corner)
+
+    # Surfaces sit half a gradient either side of each seam
+    altitudes = altitudes.copy()
+    blend_seams(altitudes,
+                west_seam + west_gradient / 2,
+                east_seam - east_gradient / 2,
+                north_seam + north_gradient / 2,
+                south_seam - south_gradient / 2)
+
+    return altitudes
+
+
+def generate_chunk(seed: int, cx: int, cy: int, width: int, height: int):
+    '''
+    Generate passes 1 and 2 for chunk (cx, cy) of a tiled world where all of the chunks are the same size.
+    The chunk's surface is joined onto seams made from its own edges and those of the chunks around it.
+    '''
+
+    surfaces = [[generate_surface(seed, cx + dx, cy + dy, width, height) for dy in (-1, 0, 1)] for dx in (-1, 0, 1)]
+
+    return join_surfaces(surfaces)
+
+
+def tile_edges(length: int, tile_size: int):
+    '''
+    Split a length into tiles of the specified size, returning the edges of each tile.
+    A short tile left over at the end is merged into the one before it so no tile is too small to blend.
+    '''
+
+    edges = list(range(0, length, tile_size)) + [length]
+
+    if len(edges) > 2 and edges[-1] - edges[-2] < tile_size // 2:
+        del edges[-2]
+
+    return edges
+
+
+def generate_tiled(seed: int, width: int, height: int, tile_size: int, executor=None):
+    '''
+    Generate passes 1 and 2 for a whole map as a grid of seamless tiles.
+    The surfaces of the tiles, plus a ring of full size tiles around the map for the outer seams, get
+    generated first and then each tile is joined onto its neighbours.
+    If an executor is specified then the surfaces are generated in parallel using it.
+    The result only depends on the seed and tile size, not on how the tiles were generated.
+    '''
+
+    x_edges = tile_edges(width, tile_size)
+    y_edges = tile_edges(height, tile_size)
+
+    tile_widths = [tile_size] + list(numpy.diff(x_edges)) + [tile_size]
+    tile_heights = [tile_size] + list(numpy.diff(y_edges)) + [tile_size]
+
+    tiles = [(tx, ty) for ty in range(len(tile_heights)) for tx in range(len(tile_widths))]
+    args = ([seed] * len(tiles),
+            [tx - 1 for tx, ty in tiles],
+            [ty - 1 for tx, ty in tiles],
+            [int(tile_widths[tx]) for tx, ty in tiles],
+            [int(tile_heights[ty]) for tx, ty in tiles])
+
+    if executor is not None:
+        results = executor.map(generate_surface, *args)
+    else:
+        results = map(generate_surface, *args)
+
+    surfaces = dict(zip(tiles, results))
+
+    altitudes = numpy.empty((width, height))
+
+    for tx in range(1, len(tile_widths) - 1):
+        for ty in range(1, len(tile_heights) - 1):
+            neighbours = [[surfaces[(tx + dx, ty + dy)] for dy in (-1, 0, 1)] for dx in (-1, 0, 1)]
+            altitudes[x_edges[tx - 1]:x_edges[tx], y_edges[ty - 1]:y_edges[ty]] = join_surfaces(neighbours)
+
+    return altitudes
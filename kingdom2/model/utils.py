@@ -1,4 +1,7 @@
 import collections
+import importlib.util
+import sys
+import threading
 
 class Event():
     # Event Types
@@ -6,30 +9,93 @@ class Event():
     STATE = "state"
     GAME = "game"
 
-    def __init__(self, name: str, description: str = None, type: str = DEFAULT):
+    # The description can be a format string that only gets formatted with args if somebody reads it
+    def __init__(self, name: str, description: str = None, type: str = DEFAULT, args: tuple = (), count: int = 1):
         self.name = name
-        self.description = description
+        self._description = description
+        self.args = args
         self.type = type
 
+        # How many things the event stands for, e.g. ticks, which adds up when repeats get coalesced into it
+        self.count = count
+
+    @property
+    def description(self):
+        if self._description is not None and len(self.args) > 0:
+            return self._description.format(*self.args)
+        return self._description
+
+    # Make a new event the same as this one that also stands for an earlier event that it follows
+    def combine(self, earlier_event):
+        return Event(self.name, self._description, self.type, self.args, self.count + earlier_event.count)
+
     def __str__(self):
-        return "{0}:{1} ({2})".format(self.name, self.description, self.type)
+        _str = "{0}:{1} ({2})".format(self.name, self.description, self.type)
+        if self.count > 1:
+            _str += " x{0}".format(self.count)
+        return _str
+
+
+class EventBus():
+    '''
+    Publishes events to anybody subscribed to their type and keeps the most recent of them in a fixed size ring
+    buffer to be read in the order that they happened.  If the buffer is full the oldest event is dropped.
+    Events of a coalesced type that follow one with the same name replace it rather than taking up a new slot.
+    '''
+
+    DEFAULT_CAPACITY = 1000
+
+    # Subscribe to this type to get every event
+    ALL = None
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, coalesce: list = ()):
+        self.events = collections.deque(maxlen=capacity)
+        self.coalesce = set(coalesce)
+        self.dropped = 0
+        self._subscribers = {}
+
+        # Events can come from more than one thread, e.g. while the map is being made
+        self._lock = threading.Lock()
 
+    def subscribe(self, event_type: str, subscriber):
+        with self._lock:
+            self._subscribers.setdefault(event_type, []).append(subscriber)
 
-class EventQueue():
-    def __init__(self):
-        self.events = collections.deque()
+    def unsubscribe(self, event_type: str, subscriber):
+        with self._lock:
+            self._subscribers.get(event_type, []).remove(subscriber)
 
     def add_event(self, new_event: Event):
-        self.events.append(new_event)
 
+        # Subscribers see every event as it was published, even ones that get coalesced in the buffer
+        with self._lock:
+            subscribers = self._subscribers.get(new_event.type, []) + self._subscribers.get(EventBus.ALL, [])
+
+        for subscriber in subscribers:
+            subscriber(new_event)
+
+        with self._lock:
+            if new_event.type in self.coalesce and len(self.events) > 0 and \
+                    self.events[-1].type == new_event.type and self.events[-1].name == new_event.name:
+                # Published events never change so the buffer gets a new event that stands for both
+                self.events[-1] = new_event.combine(self.events[-1])
+            else:
+                if len(self.events) == self.events.maxlen:
+                    self.dropped += 1
+                self.events.append(new_event)
+
+    # Get the oldest event or None if there aren't any
     def pop_event(self):
-        return self.events.pop()
+        with self._lock:
+            if len(self.events) == 0:
+                return None
+            return self.events.popleft()
 
     def size(self):
         return len(self.events)
 
     def print(self):
-        for event in self.events:
+        for event in list(self.events):
             print(event)
 
 def is_numeric(s):
@@ -40,4 +106,23 @@ def is_numeric(s):
             x = float(s)
         except:
             x = None
-    return x
\ No newline at end of file
+    return x
+
+# Get a module that is only really imported the first time that one of its attributes is used
+def lazy_import(name: str):
+
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError("No module named '{0}'".format(name), name=name)
+
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+
+    return module
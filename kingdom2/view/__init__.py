@@ -2,4 +2,5 @@ from .text_view import TextView
 from .text_view import InventoryTextView
 from .text_view import CreationsTextView
 from .text_view import WorldMapTextView
+from .text_view import WorldMapDiffTextView
 from .text_view import WorldTopoModelTextView
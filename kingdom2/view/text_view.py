@@ -1,9 +1,11 @@
 import logging
 import sys
 
-import colorama
-
 import kingdom2.model as model
+from kingdom2.model.utils import lazy_import
+
+colorama = lazy_import("colorama")
+numpy = lazy_import("numpy")
 
 
 class View():
@@ -14,8 +16,8 @@ class View():
     def initialise(self):
         pass
 
-    def tick(self):
-        self.tick_count += 1
+    def tick(self, ticks: int = 1):
+        self.tick_count += ticks
 
     def process_event(self, new_event: model.Event):
         logging.info("Default View Class event process:{0}".format(new_event))
@@ -75,10 +77,11 @@ class CreationsTextView(View):
 
 
 class WorldMapTextView(View):
-    COLOURS_DEFAULT = colorama.Fore.RESET + colorama.Back.RESET
-    COLOURS_TITLE = colorama.Fore.BLACK + colorama.Back.YELLOW
-    COLOURS_EMPTY_TILE = colorama.Fore.GREEN + colorama.Back.GREEN
-    COLOURS_NON_EMPTY_TILE = colorama.Fore.BLACK + colorama.Back.GREEN
+    # The ANSI codes for colorama's Fore and Back colours, spelt out so that colorama isn't needed until we draw
+    COLOURS_DEFAULT = "\x1b[39m" + "\x1b[49m"
+    COLOURS_TITLE = "\x1b[30m" + "\x1b[43m"
+    COLOURS_EMPTY_TILE = "\x1b[32m" + "\x1b[42m"
+    COLOURS_NON_EMPTY_TILE = "\x1b[30m" + "\x1b[42m"
 
     def __init__(self, model: model.WorldMap):
 
@@ -89,38 +92,181 @@ class WorldMapTextView(View):
         else:
             colorama.init(convert=True)
 
-    def draw(self, rect: list = None):
+    # Draw the map or the area of it in rect (x, y, width, height) at the specified level of detail
+    def draw(self, rect: list = None, level: int = 0):
+
+        # Build the whole frame first and then write it out in one go
+        sys.stdout.write(self.render(rect, level))
+        sys.stdout.flush()
+
+    # Render the map as a single string.  Runs of squares with the same colours are grouped together so that
+    # colour codes only get written where the colour changes.
+    def render(self, rect: list = None, level: int = 0):
 
         if rect is not None:
             ox, oy, width, height = rect
         else:
             ox = 0
             oy = 0
-            width = self.model.width
-            height = self.model.height
+            width, height = self.model.get_lod_size(level)
 
-        print(WorldMapTextView.COLOURS_TITLE, end="")
-        print("+" + "-" * width + "+" + WorldMapTextView.COLOURS_DEFAULT)
+        tiles = self.model.get_lod_tile_range(level, ox, oy, width, height)
+        width, height = tiles.shape
+
+        # Look up the character for every palette index in one go
+        glyphs = numpy.array([" "] + [WorldMapTextView.glyph(c) for c in self.model.palette.resources[1:]])
+
+        border = WorldMapTextView.COLOURS_TITLE + "+" + "-" * width + "+" + WorldMapTextView.COLOURS_DEFAULT + "\n"
         title = "{0:^" + str(width) + "}"
-        print(WorldMapTextView.COLOURS_TITLE, end="")
-        print("|" + title.format(self.model.name) + "|" + WorldMapTextView.COLOURS_DEFAULT)
-        print(WorldMapTextView.COLOURS_TITLE, end="")
-        print("+" + "-" * width + "+" + WorldMapTextView.COLOURS_DEFAULT)
-
-        for y in range(oy, oy + height):
-            print(WorldMapTextView.COLOURS_TITLE + "|" + WorldMapTextView.COLOURS_DEFAULT, end="")
-            row = ""
-            for x in range(ox, ox + width):
-                c = self.model.get(x, y)
-                if c is not None:
-                    row += WorldMapTextView.COLOURS_NON_EMPTY_TILE + c + WorldMapTextView.COLOURS_DEFAULT
+
+        frame = [border,
+                 WorldMapTextView.COLOURS_TITLE + "|" + title.format(self.model.name) + "|" +
+                 WorldMapTextView.COLOURS_DEFAULT + "\n",
+                 border]
+
+        # Work along each row of the map at a time
+        for row in tiles.T:
+            chars = glyphs[row]
+            is_empty = row == model.TilePalette.EMPTY
+
+            frame.append(WorldMapTextView.COLOURS_TITLE + "|")
+
+            # Find where each run of empty or non-empty squares starts and ends
+            edges = [0] + (numpy.flatnonzero(is_empty[1:] != is_empty[:-1]) + 1).tolist() + [width]
+
+            for start, end in zip(edges[:-1], edges[1:]):
+                if is_empty[start] == True:
+                    frame.append(WorldMapTextView.COLOURS_EMPTY_TILE)
                 else:
-                    row += WorldMapTextView.COLOURS_EMPTY_TILE + " " + WorldMapTextView.COLOURS_DEFAULT
+                    frame.append(WorldMapTextView.COLOURS_NON_EMPTY_TILE)
+                frame.append("".join(chars[start:end].tolist()))
+
+            frame.append(WorldMapTextView.COLOURS_TITLE + "|" + WorldMapTextView.COLOURS_DEFAULT + "\n")
+
+        frame.append(border)
 
-            print(row + WorldMapTextView.COLOURS_TITLE + "|" + WorldMapTextView.COLOURS_DEFAULT)
+        return "".join(frame)
 
-        print(WorldMapTextView.COLOURS_TITLE, end="")
-        print("+" + "-" * width + "+" + WorldMapTextView.COLOURS_DEFAULT)
+    @staticmethod
+    def glyph(c: model.Resource):
+
+        if c is None or c.graphic is None:
+            return " "
+
+        return c.graphic
+
+
+class WorldMapDiffTextView(WorldMapTextView):
+    '''
+    Keeps a map on screen and only redraws the squares that have changed since the last frame.
+    The first frame is drawn in full at the top of a cleared screen and after that each changed square is
+    drawn by moving the cursor straight to it, so a redraw costs in proportion to what changed.
+    '''
+
+    CLEAR_SCREEN = "\x1b[2J\x1b[H"
+    MOVE_CURSOR = "\x1b[{0};{1}H"
+
+    # Rows taken up by the border and title above the first row of the map
+    HEADER_ROWS = 3
+
+    def __init__(self, model: model.WorldMap, rect: list = None, level: int = 0):
+
+        super(WorldMapDiffTextView, self).__init__(model)
+
+        self.rect = rect
+        self.level = level
+        self.origin = None
+        self.last_frame = None
+        self.tracker = None
+
+    def draw(self):
+
+        if self.last_frame is None:
+            frame = self.render_full()
+        else:
+            frame = self.render_changes()
+
+        if len(frame) > 0:
+            sys.stdout.write(frame)
+            sys.stdout.flush()
+
+    def render_full(self):
+
+        if self.rect is not None:
+            ox, oy, width, height = self.rect
+        else:
+            ox = 0
+            oy = 0
+            width, height = self.model.get_lod_size(self.level)
+
+        # Remember exactly what is on screen and start listening for changes
+        self.last_frame = numpy.array(self.model.get_lod_tile_range(self.level, ox, oy, width, height))
+        self.origin = (ox, oy)
+
+        if self.tracker is None:
+            self.tracker = self.model.track_changes()
+        self.tracker.clear()
+
+        return WorldMapDiffTextView.CLEAR_SCREEN + self.render(self.rect, self.level)
+
+    def render_changes(self):
+
+        if self.tracker.is_empty is True:
+            return ""
+
+        ox, oy = self.origin
+        width, height = self.last_frame.shape
+        scale = 2 ** self.level
+
+        # Work out which squares on screen might have changed
+        candidates = set()
+        for x, y in self.tracker.squares:
+            candidates.add((x // scale - ox, y // scale - oy))
+        for x, y, area_width, area_height in self.tracker.areas:
+            for sx in range(max(x // scale - ox, 0), min((x + area_width - 1) // scale - ox + 1, width)):
+                for sy in range(max(y // scale - oy, 0), min((y + area_height - 1) // scale - oy + 1, height)):
+                    candidates.add((sx, sy))
+
+        self.tracker.clear()
+
+        frame = []
+        colours = None
+
+        for sx, sy in sorted(candidates, key=lambda xy: (xy[1], xy[0])):
+            if 0 <= sx < width and 0 <= sy < height:
+                index = self.model.get_lod_tile_range(self.level, ox + sx, oy + sy, 1, 1)[0, 0]
+                if index != self.last_frame[sx, sy]:
+                    self.last_frame[sx, sy] = index
+
+                    if index == model.TilePalette.EMPTY:
+                        new_colours = WorldMapTextView.COLOURS_EMPTY_TILE
+                    else:
+                        new_colours = WorldMapTextView.COLOURS_NON_EMPTY_TILE
+
+                    frame.append(WorldMapDiffTextView.MOVE_CURSOR.format(
+                        WorldMapDiffTextView.HEADER_ROWS + sy + 1, sx + 2))
+                    if new_colours != colours:
+                        frame.append(new_colours)
+                        colours = new_colours
+                    frame.append(WorldMapTextView.glyph(self.model.palette.get(index)))
+
+        if len(frame) == 0:
+            return ""
+
+        # Put the cursor back underneath the map
+        frame.append(WorldMapTextView.COLOURS_DEFAULT)
+        frame.append(WorldMapDiffTextView.MOVE_CURSOR.format(WorldMapDiffTextView.HEADER_ROWS + height + 2, 1))
+
+        return "".join(frame)
+
+    # Stop listening for changes to the map
+    def close(self):
+
+        if self.tracker is not None:
+            self.model.stop_tracking(self.tracker)
+            self.tracker = None
+
+        self.last_frame = None
 
 
 class WorldTopoModelTextView(View):
@@ -129,24 +275,27 @@ class WorldTopoModelTextView(View):
 
         self.model = model
 
-    def draw(self, rect: list = None):
+    # Print the altitudes of the map or the area of it in rect (x, y, width, height) at the specified level of detail
+    def draw(self, rect: list = None, level: int = 0):
 
         if rect is not None:
             ox, oy, width, height = rect
         else:
             ox = 0
             oy = 0
-            width = self.model.width
-            height = self.model.height
+            width, height = self.model.get_lod_size(level)
+
+        altitudes = self.model.get_lod_range(level, ox, oy, width, height)
+        width, height = altitudes.shape
 
-        for x in range(0, width):
+        for x in range(ox, ox + width):
             print(",{0}".format(x), end="")
         print("")
 
         for y in range(0, height):
-            row = "{0},".format(y)
+            row = "{0},".format(oy + y)
             for x in range(0, width):
-                a = self.model.topo_model_pass2[x][y]
+                a = altitudes[x, y]
                 row += "{0:.4},".format(a)
 
             print(row)
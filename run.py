@@ -1,14 +1,61 @@
+import argparse
 import kingdom2.controller as controller
 import logging
+import random
+import time
 
 def main():
 
+    parser = argparse.ArgumentParser(description="The Kingdom 2")
+    parser.add_argument("--verbose", action="store_true", help="print everything as it gets loaded")
+    parser.add_argument("--event-log", help="write all of the game's events to this JSON lines file")
+    parser.add_argument("--seed", type=int, help="the seed to play the game with")
+    parser.add_argument("--record", help="record the commands typed in to this file so they can be replayed")
+    parser.add_argument("--replay", help="replay the commands recorded in this file as fast as possible")
+    parser.add_argument("--seek", type=int, help="only replay up to this tick")
+    parser.add_argument("--checkpoint-every", type=int, default=controller.GameReplayer.DEFAULT_CHECKPOINT_INTERVAL,
+                        help="how many ticks between snapshots taken while replaying")
+    parser.add_argument("--interactive", action="store_true", help="carry on playing after replaying")
+    args = parser.parse_args()
+
+    if args.replay is None:
+        if args.seek is not None:
+            parser.error("--seek can only be used with --replay")
+        if args.interactive is True:
+            parser.error("--interactive can only be used with --replay")
+
     logging.basicConfig(level = logging.INFO)
 
-    c = controller.GameCLI()
+    if args.replay is not None:
+        replayer = controller.GameReplayer(args.replay, checkpoint_interval=args.checkpoint_every)
+        try:
+            start = time.perf_counter()
+            if args.seek is not None:
+                replayer.seek(args.seek)
+            else:
+                replayer.run()
+            print("Replayed {0} commands to tick {1} in {2:.3f}s".format(replayer.position, replayer.tick_count,
+                                                                          time.perf_counter() - start))
+            if args.interactive is True:
+                # Saves made from here on shouldn't follow on from the replayer's checkpoints as they get deleted
+                replayer.game.saver.reset()
+                replayer.cli.run()
+        finally:
+            replayer.close()
+        return
+
+    seed = args.seed
+    if seed is None:
+        seed = random.SystemRandom().getrandbits(32)
+
+    recorder = None
+    if args.record is not None:
+        recorder = controller.CommandRecorder(args.record, seed)
+
+    c = controller.GameCLI(verbose=args.verbose, event_log=args.event_log, seed=seed, recorder=recorder)
     c.run()
     return
 
 if __name__ == "__main__":
     main()
-    exit(0)
\ No newline at end of file
+    exit(0)
@@ -0,0 +1,65 @@
+import os
+
+import pytest
+
+import kingdom2.model as model
+
+DATA_DIR = os.path.join(os.path.dirname(model.__file__), "data")
+
+# The resources file was saved on Windows
+RESOURCES_ENCODING = "cp1252"
+
+
+# A copy of the game data so that the catalog cache gets written somewhere temporary.
+# The resources file is written out again in the local encoding so that it can be read anywhere.
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+
+    with open(os.path.join(DATA_DIR, "resources.csv"), "r", encoding=RESOURCES_ENCODING, newline="") as source:
+        resources = source.read()
+    with open(os.path.join(tmp_path, "resources.csv"), "w", newline="") as target:
+        target.write(resources)
+
+    with open(os.path.join(DATA_DIR, "creatables.xml"), "rb") as source:
+        creatables = source.read()
+    with open(os.path.join(tmp_path, "creatables.xml"), "wb") as target:
+        target.write(creatables)
+
+    # Games that load their own catalog, like the ones the CLI makes, use the copy as well
+    data_dir = os.path.join(str(tmp_path), "")
+    monkeypatch.setattr(model.Game, "GAME_DATA_DIR", data_dir)
+
+    return data_dir
+
+
+@pytest.fixture
+def catalog(data_dir):
+    catalog = model.Catalog(data_dir)
+    catalog.load()
+    return catalog
+
+
+# Start a game with some of every resource and one of every creatable
+def start_game(catalog, seed: int = 1):
+
+    game = model.Game("Test", seed=seed, catalog=catalog)
+    game.start()
+
+    for name in game.resources.get_resource_types():
+        game.inventory.add_resource(game.resources.get_resource(name), game.rng.randint(20, 60))
+
+    for name in game.creatables.names:
+        game.add_creation(game.creatables.get_creatable_copy(name))
+
+    return game
+
+
+# Everything about a game that playing it can change
+def get_state(game):
+    return (game.tick_count,
+            game.inventory.counts.tolist(),
+            [(creation.name, creation.ticks_done, creation.ticks_required, dict(creation.pre_requisites))
+             for creation in game.creations],
+            game.map.tiles.tolist(),
+            game.map.topo_model_pass2.tolist(),
+            game.rng.getstate())
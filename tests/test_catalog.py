@@ -0,0 +1,146 @@
+import threading
+
+import pytest
+
+import kingdom2.controller as controller
+import kingdom2.model as model
+
+
+def test_reload_keeps_creatable_ids(catalog):
+
+    creatables = catalog.creatables
+    type_ids = {name: creatables.get_creatable(name).type_id for name in creatables.names}
+
+    catalog.resources.load(verbose=False)
+    creatables.load(verbose=False)
+
+    assert {name: creatables.get_creatable(name).type_id for name in creatables.names} == type_ids
+    assert sorted(type_ids.values()) == list(range(creatables.count))
+    assert creatables.get_requirements_matrix().shape == (creatables.count,
+                                                          catalog.resources.get_resource_count())
+
+
+def test_catalog_loads_from_cache(catalog, data_dir):
+
+    cached = model.Catalog(data_dir)
+    cached.load()
+
+    assert cached.creatables.names == catalog.creatables.names
+    assert cached.resources.get_resource_types() == catalog.resources.get_resource_types()
+    assert (cached.creatables.get_requirements_matrix() == catalog.creatables.get_requirements_matrix()).all()
+
+
+def test_shared_catalog_loads_once(data_dir):
+
+    catalog = model.Catalog(data_dir)
+    loads = []
+    load = catalog._load
+    catalog._load = lambda verbose: loads.append(load(verbose))
+
+    games = [model.Game("Test {0}".format(i), seed=i, catalog=catalog) for i in range(8)]
+    threads = [threading.Thread(target=game.load_catalog) for game in games]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(loads) == 1
+    assert all(game.planner is catalog.planner for game in games)
+
+
+def test_max_buildable_ignores_zero_needs():
+
+    resources = model.ResourceFactory("resources.csv")
+    for name in ("Wood", "Stone", "Plank"):
+        resources.add_resource(model.Resource(name, name))
+
+    creatables = model.CreatableFactoryXML("creatables.xml", resources)
+
+    plank = model.Creatable("Plank", "Some planks", 2)
+    plank.add_pre_requisite("Wood", 3)
+    plank.add_output("Plank", 2)
+    creatables.add_creatable(plank)
+
+    hut = model.Creatable("Hut", "A hut", 5)
+    hut.add_pre_requisite("Plank", 3)
+    hut.add_pre_requisite("Stone", 0)
+    creatables.add_creatable(hut)
+
+    air = model.Creatable("Air", "Nothing at all", 1)
+    air.add_pre_requisite("Stone", 0)
+    creatables.add_creatable(air)
+
+    creatables.loaded()
+
+    planner = model.ProductionPlanner(creatables)
+    inventory = model.Inventory(resources)
+
+    assert planner.max_buildable("Hut", inventory) == 0
+
+    inventory.add_resource(resources.get_resource("Wood"), 100)
+
+    # 22 huts need 66 planks which is 33 lots of 3 wood
+    assert planner.max_buildable("Hut", inventory) == 22
+    assert planner.max_buildable("Plank", inventory) == 33
+    assert planner.max_buildable("Air", inventory) is None
+
+
+def test_max_buildable_uses_stock_before_making_more(catalog):
+
+    planner = catalog.planner
+    inventory = model.Inventory(catalog.resources)
+    house = catalog.creatables.get_creatable("Small Brick House")
+
+    assert planner.max_buildable("Small Brick House", inventory) == 0
+
+    # Bricks already made count towards the house without needing what makes them
+    inventory.add_resource(catalog.resources.get_resource("Bricks"), 100)
+    assert inventory.is_creatable(house) is True
+    assert planner.max_buildable("Small Brick House", inventory) == 100 // house.pre_requisites["Bricks"]
+
+
+@pytest.mark.parametrize("count", [0, -3, 2.5, "2"])
+def test_plan_rejects_bad_counts(catalog, count):
+
+    with pytest.raises(Exception):
+        catalog.planner.plan("Small Brick House", count)
+
+
+def test_plan_command_checks_its_input(data_dir, capsys):
+
+    cli = controller.GameCLI(seed=1)
+
+    # Nothing to plan with before the game has started
+    cli.onecmd("plan Small Brick House")
+    assert "Type 'start'" in capsys.readouterr().out
+
+    cli.onecmd("start")
+    capsys.readouterr()
+
+    for arg in ("-3", "2.5", "0"):
+        cli.onecmd("plan Small Brick House " + arg)
+        assert "whole number" in capsys.readouterr().out
+
+    cli.onecmd("plan Small Brick House 2")
+    assert "Plan for 2 x Small Brick House" in capsys.readouterr().out
+
+
+def test_creatable_copy_shares_then_customises_its_recipe(catalog, capsys):
+
+    prototype = catalog.creatables.get_creatable("Small Brick House")
+    copy = catalog.creatables.get_creatable_copy("Small Brick House")
+
+    assert isinstance(copy, model.Creatable) is False
+    assert copy.type_id == prototype.type_id
+    assert copy.percent_complete == 0 and copy.is_complete is False
+
+    # Changing the recipe gives the copy its own one and leaves the prototype alone
+    copy.add_pre_requisite("Wood", 2)
+    assert copy.pre_requisites["Wood"] == 2
+    assert "Wood" not in prototype.pre_requisites
+    assert copy.type_id is None
+
+    for i in range(copy.ticks_required):
+        copy.tick()
+    assert copy.is_complete is True
+    assert "Construction complete for Small Brick House!" in capsys.readouterr().out
@@ -0,0 +1,130 @@
+import json
+import os
+import threading
+
+import kingdom2.model as model
+
+
+def make_events(count: int):
+    return [model.Event("Event {0}".format(i), "Something happened", "Test") for i in range(count)]
+
+
+def read_lines(file_names):
+    lines = []
+    for file_name in file_names:
+        with open(file_name, "r", encoding="utf-8") as log:
+            lines += [json.loads(line) for line in log]
+    return lines
+
+
+# Hold the writer up inside its first batch until the test lets it go
+def stall(sink):
+
+    started = threading.Event()
+    release = threading.Event()
+    write_lines = sink._write_lines
+
+    def stalled_write_lines(lines):
+        started.set()
+        release.wait()
+        write_lines(lines)
+
+    sink._write_lines = stalled_write_lines
+
+    return started, release
+
+
+def test_files_rotate_within_a_batch(tmp_path):
+
+    file_name = os.path.join(str(tmp_path), "events.log")
+    sink = model.EventLogSink(file_name, policy=model.EventLogSink.POLICY_BLOCK, max_bytes=2000, backup_count=50)
+    started, release = stall(sink)
+
+    # Everything goes in one batch as the writer is held up
+    sink.write(model.Event("First"))
+    started.wait()
+    for event in make_events(199):
+        sink.write(event)
+    release.set()
+    sink.close()
+
+    file_names = [file_name] + ["{0}.{1}".format(file_name, i) for i in range(1, 51)]
+    file_names = [name for name in file_names if os.path.exists(name)][::-1]
+
+    assert len(file_names) > 2
+    assert all(os.path.getsize(name) <= 2000 for name in file_names)
+
+    # Nothing was lost and the files are in order from the oldest backup to the current file
+    lines = read_lines(file_names)
+    assert sink.written == 200
+    assert [line["name"] for line in lines] == ["First"] + ["Event {0}".format(i) for i in range(199)]
+
+
+def test_drop_policy_drops_when_full(tmp_path):
+
+    file_name = os.path.join(str(tmp_path), "events.log")
+    sink = model.EventLogSink(file_name, policy=model.EventLogSink.POLICY_DROP, max_backlog=10)
+    started, release = stall(sink)
+
+    sink.write(model.Event("First"))
+    started.wait()
+    for event in make_events(50):
+        sink.write(event)
+
+    assert sink.dropped == 40
+
+    release.set()
+    sink.close()
+
+    assert sink.written == 11
+    assert len(read_lines([file_name])) == 11
+
+
+def test_block_policy_waits_for_room(tmp_path):
+
+    file_name = os.path.join(str(tmp_path), "events.log")
+    sink = model.EventLogSink(file_name, policy=model.EventLogSink.POLICY_BLOCK, max_backlog=10)
+    started, release = stall(sink)
+
+    sink.write(model.Event("First"))
+    started.wait()
+
+    writer = threading.Thread(target=lambda: [sink.write(event) for event in make_events(50)])
+    writer.start()
+
+    # The writer can't get all of its events onto the queue until the sink catches up
+    writer.join(timeout=0.2)
+    assert writer.is_alive() is True
+
+    release.set()
+    writer.join()
+    sink.close()
+
+    assert sink.dropped == 0
+    assert sink.written == 51
+    assert len(read_lines([file_name])) == 51
+
+
+def test_close_writes_everything_queued(tmp_path):
+
+    file_name = os.path.join(str(tmp_path), "events.log")
+    sink = model.EventLogSink(file_name, batch_size=7)
+    started, release = stall(sink)
+
+    sink.write(model.Event("First"))
+    started.wait()
+    for event in make_events(100):
+        sink.write(event)
+
+    # Let the writer go just as it is told to stop
+    closer = threading.Thread(target=sink.close)
+    closer.start()
+    release.set()
+    closer.join()
+
+    assert sink.written == 101
+    assert len(read_lines([file_name])) == 101
+
+    # Nothing more gets written once closed
+    sink.write(model.Event("Late"))
+    assert sink.written == 101
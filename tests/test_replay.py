@@ -0,0 +1,121 @@
+import os
+
+import pytest
+
+import kingdom2.controller as controller
+
+COMMANDS = ["start", "test", "tick 2500", "inv", "test", "watch 3", "tick 1000", "tick", "tick -2"]
+
+
+def get_state(game):
+    return (game.tick_count,
+            game.inventory.counts.tolist(),
+            game.creations.get_all_ticks_done().tolist(),
+            game.creations.status[:len(game.creations)].tolist(),
+            game.rng.getstate())
+
+
+# Play the commands through the CLI, recording them as a player typing them in would
+def record(file_name, commands):
+
+    recorder = controller.CommandRecorder(file_name, 1234)
+    cli = controller.GameCLI(seed=1234, recorder=recorder)
+
+    for line in commands:
+        cli.onecmd(cli.precmd(line))
+
+    recorder.close()
+
+    return cli.model
+
+
+@pytest.fixture
+def recording(data_dir, tmp_path, capsys):
+
+    file_name = os.path.join(str(tmp_path), "session.rec")
+    game = record(file_name, COMMANDS)
+    capsys.readouterr()
+
+    return file_name, game
+
+
+def test_recording_reads_back(recording):
+
+    file_name, game = recording
+    seed, commands = controller.CommandRecorder.read(file_name)
+
+    assert seed == 1234
+    assert [line for tick, line in commands] == COMMANDS
+    assert commands[3] == (2500, "inv")
+
+
+def test_replay_matches_recording(recording):
+
+    file_name, game = recording
+    replayer = controller.GameReplayer(file_name, checkpoint_interval=500)
+
+    try:
+        replayer.run()
+        assert get_state(replayer.game) == get_state(game)
+        assert [checkpoint[0] for checkpoint in replayer.checkpoints] == [500, 1000, 1500, 2000, 2500, 3000, 3500]
+    finally:
+        replayer.close()
+
+
+def test_seek_matches_fresh_replay(recording):
+
+    file_name, game = recording
+    replayer = controller.GameReplayer(file_name, checkpoint_interval=500)
+    fresh = controller.GameReplayer(file_name)
+
+    try:
+        replayer.run()
+
+        # Back to a checkpoint and on from there...
+        fresh.run(until_tick=1200)
+        replayer.seek(1200)
+        assert replayer.tick_count == 1200
+        assert get_state(replayer.game) == get_state(fresh.game)
+
+        # ...forwards past the commands typed at tick 2500...
+        fresh.run(until_tick=3400)
+        replayer.seek(3400)
+        assert get_state(replayer.game) == get_state(fresh.game)
+
+        # ...and to the end
+        replayer.run()
+        assert get_state(replayer.game) == get_state(game)
+    finally:
+        replayer.close()
+        fresh.close()
+
+
+def test_replay_skips_ticks_the_cli_refused(data_dir, tmp_path, capsys):
+
+    # Ticking before the game has started does nothing, and neither does watching with no map
+    file_name = os.path.join(str(tmp_path), "early.rec")
+    game = record(file_name, ["tick 5", "watch 2", "start", "tick 3"])
+    capsys.readouterr()
+
+    replayer = controller.GameReplayer(file_name)
+
+    try:
+        replayer.run()
+        assert replayer.tick_count == game.tick_count == 3
+        assert get_state(replayer.game) == get_state(game)
+    finally:
+        replayer.close()
+
+
+def test_failed_checkpoints_are_not_kept(recording, tmp_path):
+
+    file_name, game = recording
+    replayer = controller.GameReplayer(file_name, checkpoint_interval=500,
+                                       checkpoint_dir=os.path.join(str(tmp_path), "missing"))
+
+    try:
+        replayer.run()
+        assert get_state(replayer.game) == get_state(game)
+        assert replayer.checkpoints == []
+    finally:
+        replayer.close()
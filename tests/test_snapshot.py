@@ -0,0 +1,80 @@
+import glob
+import os
+
+import numpy
+
+import kingdom2.model as model
+
+from .conftest import start_game
+from .conftest import get_state
+
+
+def test_snapshot_and_deltas_round_trip(catalog, tmp_path):
+
+    file_name = os.path.join(str(tmp_path), "game.k2s")
+    game = start_game(catalog)
+    resources = game.resources
+
+    custom = game.creatables.get_creatable_copy("Some Bricks")
+    custom.add_pre_requisite("Mud", 1)
+    game.add_creation(custom)
+
+    game.tick(3)
+    game.save(file_name)
+
+    game.tick(4)
+    game.map.set(1, 2, resources.get_resource("Snow"))
+    game.map.fill(3, 3, 4, 2, resources.get_resource("Earth"))
+    game.inventory.add_resource(resources.get_resource("Wood"), 7)
+    game.add_creation(game.creatables.get_creatable_copy("Small Brick House"))
+    game.save()
+
+    # A tile that isn't in the snapshot's palette and a draw from the game's random numbers
+    new_tile = [name for name in resources.get_resource_types() if name not in game.map.palette.names][0]
+    game.map.set(9, 9, resources.get_resource(new_tile))
+    game.rng.random()
+    game.tick(2)
+    game.save()
+
+    assert sorted(glob.glob(file_name + "*")) == [file_name, file_name + ".1", file_name + ".2"]
+
+    loaded = model.Game("Loaded", catalog=catalog)
+    loaded.load(file_name)
+
+    assert get_state(loaded) == get_state(game)
+
+    # Both carry on in the same way
+    game.tick(20)
+    loaded.tick(20)
+    assert get_state(loaded) == get_state(game)
+
+
+def test_delta_only_holds_changes(catalog, tmp_path):
+
+    file_name = os.path.join(str(tmp_path), "game.k2s")
+    game = model.Game("Test", seed=1, catalog=catalog)
+    game.start()
+    game.save(file_name)
+
+    game.tick(1)
+    game.map.set(4, 4, game.resources.get_resource("Earth"))
+    game.save()
+
+    with numpy.load(file_name + ".1") as data:
+        assert sorted(data.files) == ["meta", "palette", "square_tiles", "squares"]
+        assert data["palette"].tolist() == ["Earth"]
+        assert data["squares"].tolist() == [[4, 4]]
+
+    assert os.path.getsize(file_name + ".1") < os.path.getsize(file_name) / 10
+
+
+def test_full_save_removes_old_deltas(catalog, tmp_path):
+
+    file_name = os.path.join(str(tmp_path), "game.k2s")
+    game = start_game(catalog)
+    game.save(file_name)
+    game.tick(1)
+    game.save()
+    game.save(file_name)
+
+    assert sorted(glob.glob(file_name + "*")) == [file_name]
@@ -0,0 +1,107 @@
+import pytest
+
+import kingdom2.controller as controller
+import kingdom2.model as model
+
+from .conftest import start_game
+from .conftest import get_state
+
+
+def test_tick_many_matches_single_ticks(catalog):
+
+    fast = start_game(catalog)
+    slow = start_game(catalog)
+
+    for ticks in (1, 3, 7, 50):
+        fast.tick(ticks)
+        for i in range(ticks):
+            slow.tick()
+
+        assert get_state(fast) == get_state(slow)
+
+    # Changing the inventory part way through pauses and restarts creations in both
+    for game in (fast, slow):
+        wood = game.resources.get_resource("Wood")
+        game.inventory.add_resource(wood, -game.inventory.get_count(wood))
+        game.add_creation(game.creatables.get_creatable_copy("Small Brick House"))
+
+    fast.tick(25)
+    for i in range(25):
+        slow.tick()
+
+    assert get_state(fast) == get_state(slow)
+
+
+@pytest.mark.parametrize("ticks", [0, -2, 1.5, "3"])
+def test_tick_rejects_bad_counts(catalog, ticks):
+
+    game = start_game(catalog)
+    game.tick(5)
+    ticks_done = game.creations.get_all_ticks_done().tolist()
+
+    with pytest.raises(Exception):
+        game.tick(ticks)
+
+    assert game.tick_count == 5
+    assert game.creations.tick_count == 5
+    assert game.creations.get_all_ticks_done().tolist() == ticks_done
+
+
+def test_tick_event_counts_ticks(catalog):
+
+    game = start_game(catalog)
+    game.wait_for_map()
+    while game.get_next_event() is not None:
+        pass
+
+    game.tick(7)
+    for i in range(3):
+        game.tick()
+
+    event = game.get_next_event()
+    assert event.count == 10
+    assert event.description == "Game ticked to 10"
+    assert game.get_next_event() is None
+
+
+def test_coalescing_leaves_published_events_alone(catalog):
+
+    game = start_game(catalog)
+    game.wait_for_map()
+    while game.get_next_event() is not None:
+        pass
+
+    published = []
+    game.events.subscribe(model.Game.EVENT_TICK, published.append)
+
+    for ticks in (2, 3, 4):
+        game.tick(ticks)
+
+    # Subscribers keep what they were sent while the buffer holds one event for all of the ticks
+    assert [event.count for event in published] == [2, 3, 4]
+    assert [event.description for event in published] == ["Game ticked to 2", "Game ticked to 5", "Game ticked to 9"]
+
+    event = game.get_next_event()
+    assert event.count == 9
+    assert event.description == "Game ticked to 9"
+    assert all(event is not published_event for published_event in published)
+
+
+def test_watch_prints_completions_after_the_map(data_dir, capsys):
+
+    cli = controller.GameCLI(seed=1)
+    cli.onecmd("start")
+    cli.onecmd("test")
+    capsys.readouterr()
+
+    # Change the map every tick so that a frame gets drawn every tick
+    world_map = cli.model.map
+    tiles = [cli.model.resources.get_resource(name) for name in (model.WorldMap.TILE_GRASS, model.WorldMap.TILE_SEA)]
+    cli.model.events.subscribe(model.Game.EVENT_TICK, lambda event: world_map.set(0, 0, tiles[event.args[0] % 2]))
+
+    cli.onecmd("watch 30")
+    output = capsys.readouterr().out
+
+    # Nothing gets printed in between the frames of the map
+    assert "Construction complete" in output
+    assert output.index("Construction complete") > output.rindex("\x1b[")
@@ -0,0 +1,87 @@
+import numpy
+import pytest
+
+import kingdom2.model.topography as topography
+
+
+# The original pass 1, one point at a time, using random draws made in the same order as generate_altitudes()
+def reference_altitudes(width: int, height: int, rng):
+
+    clip = lambda n, minn, maxn: max(min(maxn, n), minn)
+    delta = topography.MAX_SLOPE_DELTA / 2
+
+    west_edge_slopes = rng.uniform(topography.MIN_SLOPE, topography.MAX_SLOPE, height)
+    east_deltas = [rng.uniform(-delta, delta, height) for x in range(width)]
+    north_edge_slopes = rng.uniform(topography.MIN_SLOPE, topography.MAX_SLOPE, width)
+    south_deltas = [rng.uniform(-delta, delta, width) for y in range(height)]
+    north_edge_altitudes = rng.uniform(topography.MIN_ALTITUDE, topography.MAX_ALTITUDE, width)
+    west_edge_altitudes = rng.uniform(topography.MIN_ALTITUDE, topography.MAX_ALTITUDE, height)
+
+    # The slopes leaving each point are random walks along its row and column
+    east_slopes = [[0.0] * height for x in range(width)]
+    south_slopes = [[0.0] * height for x in range(width)]
+    for y in range(height):
+        for x in range(width):
+            west_slope = west_edge_slopes[y] if x == 0 else east_slopes[x - 1][y]
+            east_slopes[x][y] = clip(west_slope + east_deltas[x][y], topography.MIN_SLOPE, topography.MAX_SLOPE)
+            north_slope = north_edge_slopes[x] if y == 0 else south_slopes[x][y - 1]
+            south_slopes[x][y] = clip(north_slope + south_deltas[y][x], topography.MIN_SLOPE, topography.MAX_SLOPE)
+
+    altitudes = [[0.0] * height for x in range(width)]
+    for y in range(height):
+        for x in range(width):
+            if y == 0:
+                north_altitude, north_slope = north_edge_altitudes[x], north_edge_slopes[x]
+            else:
+                north_altitude, north_slope = altitudes[x][y - 1], south_slopes[x][y - 1]
+
+            if x == 0:
+                west_altitude, west_slope = west_edge_altitudes[y], west_edge_slopes[y]
+            else:
+                west_altitude, west_slope = altitudes[x - 1][y], east_slopes[x - 1][y]
+
+            altitude = ((north_altitude + north_slope) + (west_altitude + west_slope)) / 2
+            altitudes[x][y] = clip(altitude, topography.MIN_ALTITUDE, topography.MAX_ALTITUDE)
+
+    return numpy.array(altitudes)
+
+
+# The original pass 2: the average of each point and whichever of its 8 neighbours are on the map
+def reference_smooth(a):
+
+    width, height = a.shape
+    smoothed = numpy.zeros((width, height))
+
+    for y in range(height):
+        for x in range(width):
+            total = 0.0
+            points = 0
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    if 0 <= x + dx < width and 0 <= y + dy < height:
+                        total += a[x + dx][y + dy]
+                        points += 1
+            smoothed[x][y] = total / points
+
+    return smoothed
+
+
+@pytest.mark.parametrize("width, height", [(1, 1), (1, 6), (6, 1), (7, 5), (5, 9), (12, 12)])
+def test_passes_match_reference(width, height):
+
+    altitudes = topography.generate_altitudes(width, height, numpy.random.default_rng(42))
+    expected = reference_altitudes(width, height, numpy.random.default_rng(42))
+
+    assert altitudes.shape == (width, height)
+    assert numpy.allclose(altitudes, expected)
+    assert numpy.allclose(topography.smooth(altitudes), reference_smooth(expected))
+
+
+def test_floor_clips_below_threshold():
+
+    a = topography.smooth(topography.generate_altitudes(20, 20, numpy.random.default_rng(1)))
+    threshold = numpy.mean(a) - numpy.std(a) * topography.MIN_ALTITUDE_CLIP_FACTOR
+    expected = numpy.where(a < threshold, threshold, a)
+
+    assert topography.apply_floor(a) == pytest.approx(threshold)
+    assert numpy.array_equal(a, expected)
@@ -0,0 +1,110 @@
+import os
+
+import numpy
+import pytest
+
+import kingdom2.controller as controller
+import kingdom2.model as model
+import kingdom2.model.topography as topography
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_chunks_meet_on_their_seams(seed):
+
+    size = 32
+    chunks = {(cx, cy): topography.generate_chunk(seed, cx, cy, size, size)
+              for cx in range(-1, 2) for cy in range(-1, 2)}
+
+    # Either side of a seam is half its gradient away from it, so never more than a slope apart
+    for (cx, cy), chunk in chunks.items():
+        east = chunks.get((cx + 1, cy))
+        if east is not None:
+            assert numpy.abs(chunk[-1] - east[0]).max() <= topography.MAX_SLOPE / 2 + 1e-9
+        south = chunks.get((cx, cy + 1))
+        if south is not None:
+            assert numpy.abs(chunk[:, -1] - south[:, 0]).max() <= topography.MAX_SLOPE / 2 + 1e-9
+
+
+@pytest.mark.parametrize("seed", [3, 5, 7])
+def test_tile_seams_are_no_steeper_than_tiles(seed):
+
+    width, height, tile_size = 300, 200, 64
+    altitudes = topography.generate_tiled(seed, width, height, tile_size)
+
+    # Split the steps between neighbouring squares into those within a blend band of a seam and the rest
+    band = tile_size // 4
+    steps = {True: [], False: []}
+    for axis, length in ((0, width), (1, height)):
+        diffs = numpy.moveaxis(numpy.abs(numpy.diff(altitudes, axis=axis)), axis, 0)
+        near = numpy.zeros(length - 1, dtype=bool)
+        for edge in topography.tile_edges(length, tile_size)[1:-1]:
+            near[edge - band:edge + band] = True
+        steps[True].append(diffs[near].ravel())
+        steps[False].append(diffs[~near].ravel())
+
+    seams = numpy.concatenate(steps[True])
+    interior = numpy.concatenate(steps[False])
+
+    # Both halves are random so allow a little noise, but no ramps steeper than the tiles themselves have
+    assert numpy.percentile(seams, 99.9) <= numpy.percentile(interior, 99.9) * 1.05
+    assert seams.max() <= interior.max() * 1.15
+
+
+def test_chunked_map_is_seamless_and_regenerates(catalog):
+
+    world = model.ChunkedWorldMap("Test", seed=5, chunk_size=16, max_chunks=4, resource_factory=catalog.resources)
+    world.initialise()
+
+    # Steps between the squares either side of the chunk edges at 0, 16 and 32
+    altitudes = numpy.array(world.get_range(-8, -8, 48, 48))
+    seams = [7, 23, 39]
+    assert numpy.abs(numpy.diff(altitudes, axis=0))[seams].max() <= topography.MAX_SLOPE / 2 + 1e-9
+    assert numpy.abs(numpy.diff(altitudes, axis=1))[:, seams].max() <= topography.MAX_SLOPE / 2 + 1e-9
+
+    # The chunks have been evicted since they were first made but come back the same
+    assert world.chunk_count <= 4
+    assert (numpy.array(world.get_range(-8, -8, 48, 48)) == altitudes).all()
+
+
+def test_lod_levels_are_checked(catalog):
+
+    world = model.WorldMap("Test", 50, 50, seed=1, resource_factory=catalog.resources)
+    world.initialise()
+
+    assert world.lod_levels == world.get_pyramid().levels == 7
+    assert world.get_lod_size(6) == (1, 1)
+
+    for level in (7, -1, 1.5):
+        with pytest.raises(Exception):
+            world.get_lod_size(level)
+        with pytest.raises(Exception):
+            world.get_lod_tile_range(level, 0, 0, 1, 1)
+
+
+def test_export_checks_its_area(catalog, tmp_path):
+
+    world = model.WorldMap("Test", 20, 10, seed=1, resource_factory=catalog.resources)
+    world.initialise()
+
+    file_name = os.path.join(str(tmp_path), "topo.npy")
+    world.export_topology(file_name, [2, 3, 5, 4])
+    exported = numpy.load(file_name)
+    assert exported.shape == (4, 5)
+    assert (exported == world.get_range(2, 3, 5, 4).T.astype(exported.dtype)).all()
+
+    for rect in ([1, 0, 0, 5], [1, 0, 5, 0], [0, 0, -1, 5], [0, 0, 2.5, 5], [10, 0, 15, 5]):
+        with pytest.raises(Exception) as error:
+            world.export_topology(file_name, rect)
+        assert error.type is Exception
+
+
+def test_export_command_reports_a_bad_area(data_dir, tmp_path, capsys):
+
+    cli = controller.GameCLI(seed=1)
+    file_name = os.path.join(str(tmp_path), "topo.npy")
+
+    for arg in ("0 0 5", "0 0 5 x", "0 0 5 2.5", "0 0 5 5 5"):
+        cli.onecmd("export {0} {1}".format(file_name, arg))
+        assert "4 whole numbers" in capsys.readouterr().out
+
+    assert os.path.exists(file_name) is False